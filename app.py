@@ -2,14 +2,30 @@
 AI-Enabled Smart Traffic Light Signal
 ======================================
 Run:  streamlit run app.py
-Deps: pip install streamlit
+Deps: pip install -r requirements.txt
 """
 
 import json
+import os
 import pathlib
+import time
+import uuid
+import numpy as np
+import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
 from streamlit.components.v1 import html as st_html
 
+from traffic_signal import assets
+from traffic_signal.engine import DEFAULT_TIMING, ROADS
+from traffic_signal.ingest import IngestService, parse_sources
+from traffic_signal.latency import PreemptionLog, now_ms
+from traffic_signal.learned import LearnedPlanner
+from traffic_signal.metrics import REGISTRY, configure_from_env
+from traffic_signal.plans import PlanTable
+from traffic_signal.shared import SharedJunction, junction_volumes
+from traffic_signal.telemetry import TelemetryStore
+
 # ── Page setup ─────────────────────────────────────────────────────────────────
 st.set_page_config(
     page_title="AI-Enabled Smart Traffic Light Signal",
@@ -18,133 +34,51 @@ st.set_page_config(
     initial_sidebar_state="collapsed",   # hide sidebar entirely — controls are inline
 )
 
-# ── Global CSS ─────────────────────────────────────────────────────────────────
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Orbitron:wght@400;700&family=Share+Tech+Mono&display=swap');
-
-/* ── Dark base ── */
-html, body,
-[data-testid="stAppViewContainer"],
-[data-testid="stHeader"],
-[data-testid="stToolbar"],
-[data-testid="stDecoration"]        { background: #020812 !important; }
-
-section.main > div                  { padding-top: 6px !important; padding-bottom: 0 !important; }
-
-/* Hide Streamlit chrome */
-#MainMenu, footer, header,
-[data-testid="stSidebar"],
-[data-testid="collapsedControl"]    { display: none !important; visibility: hidden !important; }
-
-/* ── Global font ── */
-*, p, label, div, span, li         { font-family: 'Share Tech Mono', monospace !important; color: #c8e6ff; }
-h1, h2, h3, h4                     { font-family: 'Orbitron', monospace !important; color: #00e5ff !important; }
-
-/* ── Slider ── */
-[data-testid="stSlider"] > div > div > div {
-    background: rgba(0,229,255,0.2) !important;
-}
-[data-testid="stSlider"] input[type=range]::-webkit-slider-thumb {
-    background: #00e5ff !important;
-    box-shadow: 0 0 8px rgba(0,229,255,0.7) !important;
-    width: 16px !important; height: 16px !important;
-}
-[data-testid="stSlider"] label { font-size: 0.7rem !important; color: #c8e6ff !important; }
-
-/* ── Selectbox ── */
-[data-testid="stSelectbox"] > div > div {
-    background: rgba(0,10,30,0.9) !important;
-    border: 1px solid rgba(0,229,255,0.28) !important;
-    color: #c8e6ff !important;
-    font-size: 0.72rem !important;
-}
-
-/* ── Emergency dispatch buttons ── */
-.stButton > button {
-    background: transparent !important;
-    border: 1px solid rgba(255,80,0,0.5) !important;
-    color: rgba(255,160,80,0.95) !important;
-    font-family: 'Share Tech Mono', monospace !important;
-    letter-spacing: 2px !important;
-    font-size: 0.65rem !important;
-    width: 100% !important;
-    border-radius: 5px !important;
-    padding: 8px 4px !important;
-    transition: all 0.2s !important;
-    cursor: pointer !important;
-}
-.stButton > button:hover {
-    background: rgba(255,80,0,0.18) !important;
-    border-color: #ff5000 !important;
-    color: #ff9050 !important;
-    box-shadow: 0 0 12px rgba(255,80,0,0.4) !important;
-}
-
-/* Clear / neutral buttons */
-.btn-clear button, .btn-reset button {
-    border-color: rgba(0,229,255,0.32) !important;
-    color: rgba(0,229,255,0.8) !important;
-}
-.btn-clear button:hover, .btn-reset button:hover {
-    background: rgba(0,229,255,0.09) !important;
-    box-shadow: 0 0 8px rgba(0,229,255,0.25) !important;
-}
-
-/* ── Metrics ── */
-[data-testid="stMetric"] {
-    background: rgba(0,229,255,0.04) !important;
-    border: 1px solid rgba(0,229,255,0.14) !important;
-    border-radius: 8px !important;
-    padding: 10px 12px !important;
-}
-[data-testid="stMetricLabel"] { color: rgba(200,230,255,0.45) !important; font-size: 0.6rem !important; letter-spacing:1px; }
-[data-testid="stMetricValue"] { color: #00e5ff !important; font-family:'Orbitron',monospace !important; font-size:1rem !important; }
-[data-testid="stMetricDelta"]  { font-size: 0.58rem !important; }
-
-/* ── Expander ── */
-[data-testid="stExpander"] {
-    background: rgba(0,229,255,0.02) !important;
-    border: 1px solid rgba(0,229,255,0.1) !important;
-    border-radius: 6px !important;
-}
-[data-testid="stExpander"] summary {
-    color: rgba(0,229,255,0.55) !important;
-    font-size: 0.7rem !important; letter-spacing:2px;
-}
-
-/* ── Scrollbar ── */
-::-webkit-scrollbar { width: 4px; }
-::-webkit-scrollbar-track { background: #020812; }
-::-webkit-scrollbar-thumb { background: rgba(0,229,255,0.18); border-radius:2px; }
-
-/* ── HR ── */
-hr { border-color: rgba(0,229,255,0.08) !important; }
-
-/* ── Control panel card ── */
-.ctrl-card {
-    background: linear-gradient(180deg, #050e22 0%, #030b1c 100%);
-    border: 1px solid rgba(0,229,255,0.16);
-    border-radius: 10px;
-    padding: 18px 16px;
-    height: 100%;
-}
-</style>
-""", unsafe_allow_html=True)
 
-# ── Load simulation HTML ────────────────────────────────────────────────────────
-HTML_PATH = pathlib.Path(__file__).parent / "traffic_sim_embed.html"
-if not HTML_PATH.exists():
-    st.error(f"❌ `traffic_sim_embed.html` not found at: {HTML_PATH}")
+@st.cache_resource
+def metrics_exporters():
+    """Metrics endpoint, rotating file and profiler, as the environment asks;
+    started once per process."""
+    return configure_from_env()
+
+
+metrics_exporters()
+REGISTRY.inc("app_reruns_total")
+run_timer = REGISTRY.stopwatch("app_section_seconds")   # lapped after each page section
+
+# ── Assets ─────────────────────────────────────────────────────────────────────
+# Theme CSS, fonts and the simulation page are minified, content-hashed files
+# in assets/dist (see traffic_signal/assets.py), served by Streamlit from a
+# component directory.  A session gets one <link>, and browsers cache the files.
+@st.cache_resource
+def asset_bundle():
+    """Bundle directory and hashed asset names, rebuilt first if the sources
+    changed; once per process."""
+    return assets.load()
+
+
+try:
+    ASSET_DIR, ASSETS = asset_bundle()
+except FileNotFoundError as exc:
+    st.error(f"❌ asset source not found: `{exc.filename}`")
     st.stop()
-html_source = HTML_PATH.read_text(encoding="utf-8")
+except OSError as exc:                         # neither assets/dist nor the cache is writable
+    st.error(f"❌ cannot build the page assets: {exc}")
+    st.stop()
+_asset_dir = components.declare_component("assets", path=str(ASSET_DIR))
+ASSET_URL = f"component/{_asset_dir.name}/"
+st.markdown(f'<link rel="stylesheet" href="{ASSET_URL}{ASSETS["app.css"]}">', unsafe_allow_html=True)
+run_timer.lap("setup")
 
 # ── Session state ──────────────────────────────────────────────────────────────
-if "emergency" not in st.session_state:
-    st.session_state.emergency = None
-for r in ["north", "south", "west"]:
-    if f"vol_{r}" not in st.session_state:
-        st.session_state[f"vol_{r}"] = 5
+# Signal state lives in the shared junction engine; a session only keeps its
+# own id, the last message it pushed and its own pending dispatch.
+if "sid" not in st.session_state:
+    st.session_state.sid = uuid.uuid4().hex[:12]
+JUNCTION_ID = st.query_params.get("junction", "main")
+SIM_SEED = st.query_params.get("seed")                # seeds the page's vehicle spawns
+SIM_RENDER = st.query_params.get("render")            # "canvas" or "dom" vehicle layer
+SIM_STRESS = st.query_params.get("stress")            # vehicles for a renderer load test
 
 # ══════════════════════════════════════════════════════════════════════════════
 #  PAGE HEADER
@@ -162,16 +96,190 @@ st.markdown("""
     </div>
 </div>
 """, unsafe_allow_html=True)
+run_timer.lap("header")
+
+# ─────────────────────────────────────────────────────
+#  SIMULATION BRIDGE
+# ─────────────────────────────────────────────────────
+# The simulation iframe is mounted with constant HTML, so Streamlit keeps it
+# alive across reruns.  Signal snapshots from the shared engine reach it as
+# postMessages sent by zero-height messenger components; the latest one is
+# also left in ``window.parent.__trafficCfg`` for a frame that loads later.
+# The messenger also notes the browser time of the last pointer press, which
+# becomes the ``click`` stamp of an emergency dispatch.
+MESSENGER_JS = """
+<script>
+(function() {
+  var m = %s, top = window.parent;
+  m.receivedAt = Date.now();
+  try {
+    top.__trafficCfg = m;
+    if (!top.__trafficClickHook) {
+      top.__trafficClickHook = true;
+      top.document.addEventListener('pointerdown', function() { top.__trafficClickAt = Date.now(); }, true);
+    }
+    if (m.dispatch && top.__trafficClickAt) m.dispatch.clickAt = top.__trafficClickAt;
+  } catch (e) {}
+  for (var i = 0; i < top.frames.length; i++) {
+    if (top.frames[i] !== window) top.frames[i].postMessage(m, '*');
+  }
+})();
+</script>
+"""
+
+# Returns the simulation's {type:'preemptTiming'} reports to Python.
+_preempt_probe = components.declare_component(
+    "preempt_probe", path=str(pathlib.Path(__file__).parent / "components" / "preempt_probe"))
+
+
+@st.cache_resource
+def timing_plans():
+    """Webster plans for every 1–10 volume triple, built once per process."""
+    return PlanTable.build()
+
+
+PLAN_MODES = {"LINEAR RAMP · HIGHEST VOLUME NEXT": None, "WEBSTER OPTIMAL · FIXED CYCLE": "webster",
+              "LEARNED · SIMULATOR-TRAINED": "learned"}
+PLAN_NAMES = {mode: name for name, mode in PLAN_MODES.items()}
+
+
+@st.cache_resource
+def preemption_log():
+    """Process-wide dispatch timing log, shared by every session."""
+    return PreemptionLog()
+
+
+@st.cache_resource
+def shared_junction(junction_id):
+    """One real-time engine per junction, shared by every operator session.
+
+    Sessions read its snapshot and send control changes through its command
+    queue, so N operators cost one simulation plus N dict reads.  Each
+    junction gets its own learned planner, so one junction's fallback does
+    not switch the others; the model weights are loaded once per process.
+    """
+    return SharedJunction(junction_id, DEFAULT_TIMING,
+                          planners={"webster": timing_plans().lookup, "learned": LearnedPlanner()},
+                          preemption_log=preemption_log(),
+                          telemetry=TelemetryStore())
+
+
+@st.cache_resource
+def detector_feed():
+    """Detector count ingestion, when ``TRAFFIC_DETECTORS`` lists sources
+    (e.g. ``tcp://0.0.0.0:9400,replay:counts.jsonl``); otherwise None."""
+    sources = parse_sources(os.environ.get("TRAFFIC_DETECTORS"))
+    if not sources:
+        return None
+    service = IngestService(sources).start()
+    for outcome in service.stats:
+        REGISTRY.gauge_fn("ingest_messages_total", lambda k=outcome: service.stats[k], outcome=outcome)
+    return service
+
+
+@REGISTRY.timed("app_section_seconds", section="push_signal")
+def push_signal(snap):
+    """Send ``snap`` to the simulation frame unless it already has this version.
+
+    The dispatch stamps only go to the session that dispatched, whose browser
+    adds the ``click`` time and reports the on-screen green.  ``age`` is how
+    long ago, on the server clock, the snapshot was taken; the browser stamps
+    ``receivedAt`` on its own clock, so the page never compares the two.
+    """
+    last = st.session_state.get("sim_msg")
+    if last is not None and last["version"] == snap["version"]:
+        # Nothing new: no element at all, so a poll sends the browser no
+        # delta.  The page keeps the last snapshot and times phases itself.
+        return
+    msg = dict(snap)
+    msg["age"] = max(now_ms() - snap["at"], 0.0)
+    mine = st.session_state.get("dispatch")
+    if not (mine and msg["dispatch"] and msg["dispatch"]["id"] == mine["id"]):
+        msg["dispatch"] = None
+    if SIM_SEED is not None and SIM_SEED.isdigit():
+        msg["seed"] = int(SIM_SEED)
+    if SIM_RENDER:
+        msg["render"] = SIM_RENDER
+    st.session_state["sim_msg"] = msg
+    st_html(MESSENGER_JS % json.dumps(msg), height=0)
+
+
+def panel_state(snap):
+    """The part of a snapshot the control panel's widgets show."""
+    return junction_volumes(snap), snap["planMode"], snap["planFallback"], snap["emergency"]
+
+
+def set_volumes(junction):
+    junction.submit("volumes", {r: st.session_state[f"sl_{r}"] for r in ROADS})
+
+
+def set_plan_mode(junction):
+    junction.submit("plan_mode", PLAN_MODES[st.session_state.plan_mode])
+
+
+def dispatch_emergency(junction, road):
+    """Button callback: runs before the rerun, so ``received`` is stamped as
+    soon as the click reaches the server, and waits until the engine applied
+    the dispatch."""
+    stamp = preemption_log().received(road) if road else None
+    st.session_state.dispatch = stamp
+    if road:
+        junction.submit("dispatch", road, stamp)
+    else:
+        junction.submit("clear")
+
+
+def dispatch_selected(junction):
+    road = {"North ↑": "north", "South ↓": "south", "West ←": "west"}.get(st.session_state.emg_sel)
+    if road:
+        dispatch_emergency(junction, road)
+
+
+def render_latency(log):
+    """Preemption latency summary and a click → green histogram."""
+    summary = log.summary()
+    rows = "".join(
+        f"{name.upper()} &nbsp;: <span style='color:#ff9050;'>"
+        + (f"p50 {v['p50']*1000:.0f} ms · p95 {v['p95']*1000:.0f} ms" if v["count"] else "—")
+        + f"</span> <span style='color:rgba(200,230,255,0.25);'>({v['count']})</span><br>"
+        for name, v in summary.items()
+    )
+    upper, counts = log.spans["click→green"].buckets()
+    peak = int(counts.max()) if counts.size else 1
+    bars = "".join(
+        f"<div title='≤ {u:.3g} s: {c}' style='flex:1;align-self:flex-end;"
+        f"height:{max(4, int(c / peak * 100))}%;background:rgba(255,120,50,0.55);'></div>"
+        for u, c in zip(upper, counts)
+    )
+    st.markdown(f"""
+    <div style="background:rgba(255,80,0,0.03);border:1px solid rgba(255,80,0,0.14);
+                border-radius:7px;padding:10px 12px;font-size:0.55rem;
+                color:rgba(200,230,255,0.4);line-height:1.9;margin-top:10px;">
+        <div style="color:rgba(255,120,50,0.7);font-family:'Orbitron',monospace;
+                    font-size:0.48rem;letter-spacing:2px;margin-bottom:5px;">
+            ⏱ PREEMPTION LATENCY
+        </div>
+        {rows}
+        <div style="display:flex;gap:2px;height:28px;margin-top:6px;">{bars}</div>
+    </div>
+    """, unsafe_allow_html=True)
 
-# ══════════════════════════════════════════════════════════════════════════════
-#  MAIN TWO-COLUMN LAYOUT  (controls | simulation)
-# ══════════════════════════════════════════════════════════════════════════════
-left_col, right_col = st.columns([1, 2.2], gap="large")
 
 # ─────────────────────────────────────────────────────
 #  LEFT — CONTROL PANEL
 # ─────────────────────────────────────────────────────
-with left_col:
+@st.fragment
+@REGISTRY.timed("app_section_seconds", section="control_panel")
+def control_panel(junction, feed, snapshot_slot):
+    """Left column.  Runs as a fragment: a slider move or dispatch click reruns
+    only this function, and the simulation iframe is left mounted."""
+
+    # Commands were applied by the widget callbacks, so this snapshot already
+    # shows them; it leaves for the simulation before anything else is drawn.
+    snap = junction.snapshot(st.session_state.sid)
+    push_signal(snap)
+    st.session_state.panel_state = panel_state(snap)
+    emergency = snap["emergency"]
 
     # Panel header
     st.markdown("""
@@ -186,36 +294,54 @@ with left_col:
     # ══════════════════════════════════════════════
     #  SECTION 1 — TRAFFIC VOLUME
     # ══════════════════════════════════════════════
-    st.markdown("""
+    st.markdown(f"""
     <div style="font-family:'Orbitron',monospace;font-size:0.52rem;letter-spacing:3px;
                 color:rgba(0,229,255,0.7);border-bottom:1px solid rgba(0,229,255,0.12);
                 padding-bottom:5px;margin-bottom:10px;">
         📊 &nbsp; TRAFFIC VOLUME
     </div>
     <p style="font-size:0.58rem;color:rgba(200,230,255,0.35);margin:0 0 10px;line-height:1.6;">
-        Higher value → longer green phase (5s – 18s).
+        Higher value → longer green phase ({DEFAULT_TIMING.min_green:g}s – {DEFAULT_TIMING.max_green:g}s).
     </p>
     """, unsafe_allow_html=True)
 
+    # Widgets show the shared state, which another operator or the detector
+    # feed may have changed.  A live feed owns the volumes.
+    volumes = junction_volumes(snap)
+    live = feed is not None and feed.is_live(junction.junction_id)
+    for road in ROADS:
+        st.session_state[f"sl_{road}"] = volumes[road]
+    st.session_state.plan_mode = PLAN_NAMES[snap["planMode"]]
+    greens, order = snap["greens"], snap["order"]
+
+    st.selectbox("Timing plan", options=list(PLAN_MODES), key="plan_mode",
+                 label_visibility="collapsed", on_change=set_plan_mode, args=(junction,))
+
+    if live:
+        st.markdown(f"""
+        <div style="font-size:0.52rem;letter-spacing:2px;color:#00ff88;margin:-4px 0 10px;">
+            ● &nbsp; DETECTOR FEED LIVE · {feed.windows.window:g}s WINDOW
+        </div>
+        """, unsafe_allow_html=True)
+
     road_cfg = {
         "north": {"arrow": "↑", "label": "NORTH ROAD", "color": "#00ff88", "dim": "#005533"},
         "south": {"arrow": "↓", "label": "SOUTH ROAD", "color": "#00aaff", "dim": "#003366"},
         "west":  {"arrow": "←", "label": "WEST ROAD",  "color": "#bb77ff", "dim": "#440077"},
     }
 
-    volumes = {}
     for road, cfg in road_cfg.items():
-        vol = st.slider(
+        st.slider(
             f"{cfg['arrow']}  {cfg['label']}",
             min_value=1, max_value=10,
-            value=st.session_state[f"vol_{road}"],
             key=f"sl_{road}",
+            on_change=set_volumes, args=(junction,),
+            disabled=live,
         )
-        st.session_state[f"vol_{road}"] = vol
-        volumes[road] = vol
+        vol = volumes[road]
 
         pct  = int(vol / 10 * 100)
-        gdur = int(5 + (vol - 1) / 9 * 13)
+        gdur = int(greens[road])
         c, d = cfg["color"], cfg["dim"]
 
         st.markdown(f"""
@@ -234,9 +360,8 @@ with left_col:
         """, unsafe_allow_html=True)
 
     # Summary
-    nd = int(5 + (volumes["north"]-1)/9*13)
-    sd = int(5 + (volumes["south"]-1)/9*13)
-    wd = int(5 + (volumes["west"]-1)/9*13)
+    gdurs = {r: int(g) for r, g in greens.items()}
+    nd, sd, wd = gdurs["north"], gdurs["south"], gdurs["west"]
     st.markdown(f"""
     <div style="background:rgba(0,229,255,0.04);border:1px solid rgba(0,229,255,0.1);
                 border-radius:7px;padding:10px 12px;font-size:0.58rem;
@@ -273,49 +398,47 @@ with left_col:
 
     q1, q2, q3 = st.columns(3)
     with q1:
-        if st.button("↑ NORTH", key="qn", use_container_width=True):
-            st.session_state.emergency = "north"; st.rerun()
+        st.button("↑ NORTH", key="qn", use_container_width=True,
+                  on_click=dispatch_emergency, args=(junction, "north"))
     with q2:
-        if st.button("↓ SOUTH", key="qs", use_container_width=True):
-            st.session_state.emergency = "south"; st.rerun()
+        st.button("↓ SOUTH", key="qs", use_container_width=True,
+                  on_click=dispatch_emergency, args=(junction, "south"))
     with q3:
-        if st.button("← WEST", key="qw", use_container_width=True):
-            st.session_state.emergency = "west"; st.rerun()
+        st.button("← WEST", key="qw", use_container_width=True,
+                  on_click=dispatch_emergency, args=(junction, "west"))
 
     st.markdown("""<div style="font-size:0.5rem;letter-spacing:2px;color:rgba(200,230,255,0.25);
                 margin:10px 0 5px;">OR MANUAL SELECT</div>""", unsafe_allow_html=True)
 
     emg_opts = ["— None —", "North ↑", "South ↓", "West ←"]
-    emg_map  = {"North ↑": "north", "South ↓": "south", "West ←": "west"}
     cur_idx  = 0
-    if st.session_state.emergency:
-        cur_idx = {"north":1,"south":2,"west":3}.get(st.session_state.emergency, 0)
+    if emergency:
+        cur_idx = {"north":1,"south":2,"west":3}.get(emergency, 0)
 
-    chosen = st.selectbox("Road", options=emg_opts, index=cur_idx,
+    st.selectbox("Road", options=emg_opts, index=cur_idx,
                           key="emg_sel", label_visibility="collapsed")
 
     d1, d2 = st.columns([3, 2])
     with d1:
-        if st.button("🚨  DISPATCH", key="btn_dispatch", use_container_width=True):
-            if chosen != "— None —":
-                st.session_state.emergency = emg_map[chosen]; st.rerun()
+        st.button("🚨  DISPATCH", key="btn_dispatch", use_container_width=True,
+                  on_click=dispatch_selected, args=(junction,))
     with d2:
         st.markdown('<div class="btn-clear">', unsafe_allow_html=True)
-        if st.button("✕ CLEAR", key="btn_clear", use_container_width=True):
-            st.session_state.emergency = None; st.rerun()
+        st.button("✕ CLEAR", key="btn_clear", use_container_width=True,
+                  on_click=dispatch_emergency, args=(junction, None))
         st.markdown('</div>', unsafe_allow_html=True)
 
     # Status badge
-    if st.session_state.emergency:
+    if emergency:
         icons = {"north":"↑","south":"↓","west":"←"}
-        ic = icons[st.session_state.emergency]
+        ic = icons[emergency]
         st.markdown(f"""
         <div style="background:rgba(255,40,0,0.09);border:1px solid rgba(255,80,0,0.55);
                     border-radius:8px;padding:11px 13px;font-size:0.63rem;
                     color:rgba(255,165,80,0.95);line-height:2.0;margin-top:10px;
                     animation:ep 1.1s infinite alternate;">
             🚨 &nbsp;<b>EMERGENCY ACTIVE</b><br>
-            ROAD &nbsp;&nbsp;&nbsp;: &nbsp;{ic} {st.session_state.emergency.upper()}<br>
+            ROAD &nbsp;&nbsp;&nbsp;: &nbsp;{ic} {emergency.upper()}<br>
             STATUS &nbsp;: PRIORITY GRANTED<br>
             SIGNAL &nbsp;: FORCED GREEN ✅
         </div>
@@ -335,6 +458,11 @@ with left_col:
         </div>
         """, unsafe_allow_html=True)
 
+    log = preemption_log()
+    for report in _preempt_probe(key="preempt_probe", default=[]) or []:
+        log.report(report)
+    render_latency(log)
+
     st.markdown("---")
 
     # ══════════════════════════════════════════════
@@ -348,9 +476,17 @@ with left_col:
     </div>
     """, unsafe_allow_html=True)
 
-    mode_color = "#ff8040" if st.session_state.emergency else "#00e5ff"
-    mode_label = "EMERGENCY" if st.session_state.emergency else "ADAPTIVE"
+    mode_color = "#ff8040" if emergency else "#00e5ff"
+    mode_label = "EMERGENCY" if emergency else "ADAPTIVE"
     peak_road  = max(volumes, key=volumes.get)
+    if order:
+        sequence = " → ".join(r[0].upper() for r in order) + " → …"
+        priority = ("learned split" if snap["planMode"] == "learned" else "Webster split") + ", busiest first"
+    else:
+        sequence = "N → S → W → …"
+        priority = "highest volume first"
+        if snap["planFallback"]:               # the chosen planner gave no plan
+            priority = f'<span style="color:#ff8040;">{snap["planFallback"]}, linear ramp</span> · {priority}'
     peak_color = {"north":"#00ff88","south":"#00aaff","west":"#bb77ff"}[peak_road]
 
     st.markdown(f"""
@@ -361,10 +497,11 @@ with left_col:
             <span style="color:{mode_color};">{mode_label}</span><br>
         <b style="color:rgba(0,229,255,0.62);">PEAK ROAD</b> :
             <span style="color:{peak_color};">{peak_road.upper()} (vol {volumes[peak_road]})</span><br>
-        <b style="color:rgba(0,229,255,0.62);">YELLOW</b> &nbsp;&nbsp;&nbsp;&nbsp;: 2.5 s fixed<br>
-        <b style="color:rgba(0,229,255,0.62);">ALL-RED</b> &nbsp;&nbsp;&nbsp;: 0.3 s buffer<br>
-        <b style="color:rgba(0,229,255,0.62);">SEQUENCE</b> &nbsp;&nbsp;: N → S → W → …<br>
-        <b style="color:rgba(0,229,255,0.62);">PRIORITY</b> &nbsp;&nbsp;: highest volume first
+        <b style="color:rgba(0,229,255,0.62);">YELLOW</b> &nbsp;&nbsp;&nbsp;&nbsp;: {DEFAULT_TIMING.yellow:g} s fixed<br>
+        <b style="color:rgba(0,229,255,0.62);">ALL-RED</b> &nbsp;&nbsp;&nbsp;: {DEFAULT_TIMING.all_red:g} s buffer<br>
+        <b style="color:rgba(0,229,255,0.62);">SEQUENCE</b> &nbsp;&nbsp;: {sequence}<br>
+        <b style="color:rgba(0,229,255,0.62);">PRIORITY</b> &nbsp;&nbsp;: {priority}<br>
+        <b style="color:rgba(0,229,255,0.62);">OPERATORS</b> : {junction.session_count()} on {junction.junction_id.upper()}
     </div>
     <div style="text-align:center;font-size:0.48rem;letter-spacing:2px;
                 color:rgba(0,229,255,0.16);padding-top:14px;">
@@ -372,42 +509,141 @@ with left_col:
     </div>
     """, unsafe_allow_html=True)
 
+    with snapshot_slot.container():
+        render_snapshot(volumes, gdurs, emergency)
+
+
 # ─────────────────────────────────────────────────────
-#  RIGHT — SIMULATION
+#  SIGNAL FEED  (keeps this session in step with the shared engine)
 # ─────────────────────────────────────────────────────
-with right_col:
+# Every open page runs this fragment, so its interval sets the server's idle
+# load.  The page times phases itself from each snapshot's ``remaining``; the
+# poll only brings in changes made elsewhere (another operator, a detector
+# feed), which therefore show up within 2 s.
+@st.fragment(run_every=2)
+@REGISTRY.timed("app_section_seconds", section="signal_feed")
+def signal_feed(junction):
+    """Forward phase changes to the simulation frame.  A change made by another
+    operator also reruns the page so the control panel shows it."""
+    snap = junction.snapshot(st.session_state.sid)
+    push_signal(snap)
+    if st.session_state.get("panel_state", panel_state(snap)) != panel_state(snap):
+        st.rerun()
 
-    # Build config payload & inject into simulation HTML
-    config_payload = {
-        "type": "config",
-        "volumes": volumes,
-        "emergency": st.session_state.emergency,
-    }
 
-    full_html = html_source.replace(
-        "</body>",
-        f"""
-<script>
-window.addEventListener('load', function() {{
-  var cfg = {json.dumps(config_payload)};
-  if (cfg.volumes) Object.assign(volumes, cfg.volumes);
-  if (cfg.emergency) {{
-    state.emergency = cfg.emergency;
-    state.emgHandled = false;
-    var o = document.getElementById('emg-ov');
-    if (o) o.className = 'emg-ov on';
-  }} else {{
-    state.emergency = null;
-    state.emgHandled = false;
-    var o = document.getElementById('emg-ov');
-    if (o) o.className = 'emg-ov';
-  }}
-}});
-</script>
-</body>""",
-    )
+# ─────────────────────────────────────────────────────
+#  LIVE SNAPSHOT  (drawn into a slot below both columns)
+# ─────────────────────────────────────────────────────
+def render_snapshot(volumes, gdurs, emergency):
+    m1, m2, m3, m4, m5 = st.columns(5)
+    vn, vs, vw = volumes["north"], volumes["south"], volumes["west"]
+    busiest = max(volumes, key=volumes.get)
+
+    with m1: st.metric("↑ NORTH",    f"{vn}/10", delta=f"~{gdurs['north']}s green")
+    with m2: st.metric("↓ SOUTH",    f"{vs}/10", delta=f"~{gdurs['south']}s green")
+    with m3: st.metric("← WEST",     f"{vw}/10", delta=f"~{gdurs['west']}s green")
+    with m4:
+        emg_v = emergency.upper() if emergency else "NONE"
+        st.metric("🚨 EMERGENCY", emg_v,
+                  delta="PRIORITY ACTIVE" if emergency else "Normal mode")
+    with m5:
+        st.metric("⚡ PEAK ROAD", busiest.upper(), delta=f"vol {volumes[busiest]}/10")
+
+
+# ─────────────────────────────────────────────────────
+#  LIVE TELEMETRY  (charts from the junction's telemetry rings)
+# ─────────────────────────────────────────────────────
+TELEMETRY_WINDOWS = {"5 MIN": 300, "1 H": 3600, "24 H": 86400, "7 D": 7 * 86400, "28 D": 28 * 86400}
+ROAD_COLORS = {"north": "#00ff88", "south": "#00aaff", "west": "#bb77ff"}
+
+
+def telemetry_frame(t, values, name):
+    """Long-form frame (time, road, value) from a (points, 3) array."""
+    return pd.DataFrame({
+        "time": pd.to_datetime(np.repeat(t, len(ROADS)), unit="s"),
+        "road": np.tile(ROADS, len(t)),
+        name: np.asarray(values, dtype=np.float64).ravel(),
+    })
+
+
+def telemetry_chart(data, layers, title):
+    st.vega_lite_chart(data, {
+        "height": 170,
+        "background": "transparent",
+        "title": {"text": title, "color": "#00e5ff", "fontSize": 10, "anchor": "start"},
+        "encoding": {
+            "x": {"field": "time", "type": "temporal", "title": None},
+            "color": {"field": "road", "type": "nominal", "legend": None,
+                      "scale": {"domain": list(ROAD_COLORS), "range": list(ROAD_COLORS.values())}},
+        },
+        "layer": layers,
+        "config": {"axis": {"labelColor": "#6f8fa8", "gridColor": "#0b1c33", "domainColor": "#0b1c33"},
+                   "view": {"stroke": None}},
+    }, use_container_width=True)
+
+
+@st.fragment(run_every=10)                     # charts of 5 min and up; 10 s is fresh enough
+@REGISTRY.timed("app_section_seconds", section="telemetry_panel")
+def telemetry_panel(store):
+    """Throughput, queue and green split over the chosen window.  Each chart
+    is one ``series()`` query, already downsampled to at most 300 points."""
+    label = st.radio("Window", list(TELEMETRY_WINDOWS), horizontal=True, key="tl_window",
+                     label_visibility="collapsed")
+    t1 = time.time()
+    t0 = t1 - TELEMETRY_WINDOWS[label]
+    c1, c2, c3 = st.columns(3)
+
+    served = store.series("served", t0, t1, 300)
+    if served["t"].size < 2:
+        st.caption("Collecting telemetry…")
+        return
+    # Cumulative departures → vehicles per minute between buckets.
+    rate = np.diff(served["max"], axis=0) / np.diff(served["t"])[:, None] * 60
+    with c1:
+        telemetry_chart(telemetry_frame(served["t"][1:], rate, "veh_min"),
+                        [{"mark": "line", "encoding": {"y": {"field": "veh_min", "type": "quantitative",
+                                                            "title": "veh/min"}}}],
+                        "THROUGHPUT")
+
+    q = store.series("queue", t0, t1, 300)
+    data = telemetry_frame(q["t"], q["min"], "min")
+    data["max"] = np.asarray(q["max"], dtype=np.float64).ravel()
+    data["mean"] = (q["sum"] / q["n"][:, None]).ravel()
+    with c2:
+        telemetry_chart(data, [
+            {"mark": {"type": "area", "opacity": 0.25},
+             "encoding": {"y": {"field": "min", "type": "quantitative", "title": "vehicles"},
+                          "y2": {"field": "max"}}},
+            {"mark": "line", "encoding": {"y": {"field": "mean", "type": "quantitative"}}},
+        ], "QUEUE · MIN–MAX")
+
+    g = store.series("green_s", t0, t1, 300)
+    share = g["sum"] / np.maximum(g["sum"].sum(axis=1, keepdims=True), 1e-9)
+    with c3:
+        telemetry_chart(telemetry_frame(g["t"], share, "share"),
+                        [{"mark": "area", "encoding": {"y": {"field": "share", "type": "quantitative",
+                                                             "stack": "normalize", "title": "green share"}}}],
+                        "PHASE SPLIT")
+
 
-    st_html(full_html, height=640, scrolling=False)
+# ══════════════════════════════════════════════════════════════════════════════
+#  MAIN TWO-COLUMN LAYOUT  (controls | simulation)
+# ══════════════════════════════════════════════════════════════════════════════
+left_col, right_col = st.columns([1, 2.2], gap="large")
+
+# ─────────────────────────────────────────────────────
+#  RIGHT — SIMULATION  (mounted once; never re-rendered with new content)
+# ─────────────────────────────────────────────────────
+junction = shared_junction(JUNCTION_ID)
+feed = detector_feed()
+if feed is not None:
+    feed.attach(junction)
+
+with right_col:
+    # Read by the page from its own URL, so the mounted src stays constant.
+    stress = f"?stress={SIM_STRESS}" if SIM_STRESS is not None and SIM_STRESS.isdigit() else ""
+    components.iframe(ASSET_URL + ASSETS["sim.html"] + stress, height=640, scrolling=False)
+run_timer.lap("simulation")
 
 # ══════════════════════════════════════════════════════════════════════════════
 #  METRICS STRIP (below both columns)
@@ -419,19 +655,24 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-m1, m2, m3, m4, m5 = st.columns(5)
-vn, vs, vw = volumes["north"], volumes["south"], volumes["west"]
-busiest = max(volumes, key=volumes.get)
+snapshot_slot = st.empty()
+
+with left_col:
+    control_panel(junction, feed, snapshot_slot)
+
+# After the panel, so a full run compares against what the panel just drew.
+with right_col:
+    signal_feed(junction)
+
+st.markdown("""
+<div style="font-size:0.55rem;letter-spacing:2px;color:rgba(0,229,255,0.28);
+            text-align:center;padding:8px 0 4px;border-top:1px solid rgba(0,229,255,0.07);">
+    ▸ &nbsp; LIVE TELEMETRY
+</div>
+""", unsafe_allow_html=True)
 
-with m1: st.metric("↑ NORTH",    f"{vn}/10", delta=f"~{int(5+(vn-1)/9*13)}s green")
-with m2: st.metric("↓ SOUTH",    f"{vs}/10", delta=f"~{int(5+(vs-1)/9*13)}s green")
-with m3: st.metric("← WEST",     f"{vw}/10", delta=f"~{int(5+(vw-1)/9*13)}s green")
-with m4:
-    emg_v = st.session_state.emergency.upper() if st.session_state.emergency else "NONE"
-    st.metric("🚨 EMERGENCY", emg_v,
-              delta="PRIORITY ACTIVE" if st.session_state.emergency else "Normal mode")
-with m5:
-    st.metric("⚡ PEAK ROAD", busiest.upper(), delta=f"vol {volumes[busiest]}/10")
+telemetry_panel(junction.telemetry)
+run_timer.lap("panels")
 
 # ══════════════════════════════════════════════════════════════════════════════
 #  HOW IT WORKS + FOOTER
@@ -459,3 +700,4 @@ st.markdown("""
     ⬡ &nbsp; Made by <span style="color:#00e5ff;letter-spacing:3px;">Aman Kumar</span> &nbsp; ⬡
 </div>
 """, unsafe_allow_html=True)
+run_timer.lap("footer")
@@ -0,0 +1,45 @@
+"""Asset bundle: where load() builds when the package directory is read-only."""
+
+import errno
+
+import pytest
+
+from traffic_signal import assets
+
+
+@pytest.fixture
+def readonly(monkeypatch, tmp_path):
+    """``tmp_path/dist`` refuses writes, as on a read-only install."""
+    dist = tmp_path / "dist"
+    build = assets.build
+
+    def guarded(src, sim, out):
+        if out == dist:
+            raise PermissionError(errno.EROFS, "Read-only file system", str(out))
+        return build(src, sim, out)
+
+    monkeypatch.setattr(assets, "build", guarded)
+    return dist
+
+
+def test_builds_in_place(tmp_path):
+    out = tmp_path / "dist"
+    d, files = assets.load.__wrapped__(out=out, cache=tmp_path / "cache")
+    assert d == out
+    assert (out / files["sim.html"]).exists()
+    assert not (tmp_path / "cache").exists()
+
+
+def test_read_only_dist_falls_back_to_cache(readonly, tmp_path):
+    cache = tmp_path / "cache"
+    d, files = assets.load.__wrapped__(out=readonly, cache=cache)
+    assert d == cache
+    assert {"app.css", "sim.html", "sim.js", "sim.css"} <= files.keys()
+    assert all((cache / f).exists() for f in files.values())
+    # A later process finds the cached build without rebuilding.
+    assert assets.load.__wrapped__(out=readonly, cache=cache) == (cache, files)
+
+
+def test_missing_source_is_not_a_permission_problem(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        assets.load.__wrapped__(src=tmp_path / "nowhere", out=tmp_path / "dist", cache=tmp_path / "cache")
@@ -0,0 +1,100 @@
+"""SignalEngine against the scalar Controller it vectorises."""
+
+import numpy as np
+import pytest
+
+from traffic_signal.engine import DEFAULT_TIMING, NO_ROAD, ROADS, Controller, SignalEngine
+
+
+class Reference:
+    """A Controller with its own clock, advanced event by event."""
+
+    def __init__(self, volumes):
+        self.c = Controller(DEFAULT_TIMING, volumes)
+        self.t = 0.0
+        self.due = DEFAULT_TIMING.start_delay
+        self.last = -1.0                           # time of the latest phase change
+
+    def advance_to(self, t):
+        while self.due <= t:
+            self.t = self.last = self.due
+            self.due = self.t + self.c.fire()
+        self.t = t
+
+    def dispatch(self, road):
+        dur = self.c.dispatch(road)
+        if dur is not None:
+            self.due = self.t + dur
+
+    def near_event(self, t, eps=1e-6):
+        return abs(self.due - t) < eps or abs(self.last - t) < eps
+
+
+def run_pair(seed, n=40, duration=900.0, events=30):
+    rng = np.random.default_rng(seed)
+    vols = rng.integers(1, 11, size=(n, len(ROADS)))
+    eng = SignalEngine(n, DEFAULT_TIMING, volumes=vols)
+    refs = [Reference(v) for v in vols]
+    # Dispatches, clears and volume changes at random times, one junction each.
+    plan = sorted((float(rng.uniform(1, duration)), int(rng.integers(n)), int(rng.integers(3)),
+                   int(rng.integers(len(ROADS)))) for _ in range(events * n))
+    samples = np.arange(0.137, duration, 0.731)
+    checked = 0
+    ev = 0
+    for ts in samples:
+        while ev < len(plan) and plan[ev][0] <= ts:
+            te, j, kind, road = plan[ev]
+            ev += 1
+            eng.advance(te - eng.t)
+            for r in refs:
+                r.advance_to(te)
+            if kind == 0:
+                eng.dispatch(j, ROADS[road])
+                refs[j].dispatch(ROADS[road])
+            elif kind == 1:
+                eng.clear_emergency(j)
+                refs[j].c.clear_emergency()
+            else:
+                v = rng.integers(1, 11, size=len(ROADS))
+                eng.set_volumes(j, v)
+                refs[j].c.set_volumes(v)
+        eng.advance(ts - eng.t)
+        for j, r in enumerate(refs):
+            r.advance_to(ts)
+            if r.near_event(ts):                   # float ties on a phase boundary
+                continue
+            assert (eng.green[j], eng.phase[j], eng.cycles[j], eng.emergency[j]) == \
+                (r.c.green, r.c.phase, r.c.cycles, r.c.emergency), (seed, j, ts)
+            assert eng.remaining[j] == pytest.approx(r.due - ts, abs=1e-6)
+            checked += 1
+    return checked
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_controller_with_emergencies(seed):
+    assert run_pair(seed) > 0
+
+
+def test_period_skip_matches_controller():
+    rng = np.random.default_rng(7)
+    vols = rng.integers(1, 11, size=(200, len(ROADS)))
+    eng = SignalEngine(len(vols), DEFAULT_TIMING, volumes=vols)
+    eng.advance(6 * 3600.0)                        # one call: whole periods in closed form
+    for j, v in enumerate(vols):
+        r = Reference(v)
+        r.advance_to(6 * 3600.0)
+        if r.near_event(6 * 3600.0, 1e-3):
+            continue
+        assert (eng.green[j], eng.phase[j], eng.cycles[j]) == (r.c.green, r.c.phase, r.c.cycles)
+
+
+def test_plan_order_matches_controller():
+    eng = SignalEngine(1, DEFAULT_TIMING, volumes=(3, 8, 5))
+    eng.set_plan(0, [7.0, 12.0, 9.0], [2, 0, 1])
+    r = Reference((3, 8, 5))
+    r.c.set_plan([7.0, 12.0, 9.0], [2, 0, 1])
+    for ts in np.arange(0.25, 600, 1.1):
+        eng.advance(ts - eng.t)
+        r.advance_to(ts)
+        assert (eng.green[0], eng.phase[0], eng.cycles[0]) == (r.c.green, r.c.phase, r.c.cycles)
+    assert eng.emergency[0] == NO_ROAD
@@ -0,0 +1,80 @@
+"""Detector ingest: bad lines are dropped without stopping the service."""
+
+import json
+import math
+import time
+
+import pytest
+
+from traffic_signal.ingest import IngestService, parse_message
+
+BAD = [
+    '{"road": 0, "count": 1}',
+    '{"road": "east", "count": 1}',
+    '{"road": ["north"]}',
+    '{"road": "north", "count": NaN}',
+    '{"road": "north", "count": Infinity}',
+    '{"road": "north", "count": -2}',
+    '{"road": "north", "count": "x"}',
+    '{"road": "north", "t": NaN}',
+    '{"road": "north", "t": -Infinity}',
+    '[1, 2]',
+    '7',
+    'not json',
+]
+
+
+@pytest.mark.parametrize("line", BAD)
+def test_bad_lines_are_rejected(line):
+    assert parse_message(line, 100.0) is None
+
+
+def test_good_lines():
+    assert parse_message('{"road": "west", "count": 2, "t": 50}', 100.0) == ("main", "west", 2.0, 50.0)
+    assert parse_message('{"junction": "j2", "road": "north"}', 100.0) == ("j2", "north", 1.0, 100.0)
+    assert parse_message('{"road": "south", "t": 500}', 100.0)[3] == 100.0   # not from the future
+    assert parse_message('{"road": "south"}', math.inf)[3] == math.inf       # unpaced replay
+
+
+def _run(service, until):
+    published = []
+    service.sink = lambda junction, vols: published.append(vols)
+    service.start()
+    try:
+        deadline = time.monotonic() + 5.0
+        while not until(published) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert service._thread.is_alive()
+        return published
+    finally:
+        service.stop()
+
+
+def test_bad_lines_do_not_stop_the_service(tmp_path):
+    feed = tmp_path / "counts.jsonl"
+    good = [json.dumps({"road": r, "count": 3}) for r in ("north", "south", "west")]
+    feed.write_text("\n".join(BAD + good + BAD + good) + "\n")
+    service = IngestService([f"replay:{feed}"], interval=0.05)
+    published = _run(service, lambda p: bool(p))
+    assert published
+    assert service.stats["bad"] == 2 * len(BAD)
+    assert service.stats["received"] == 2 * len(good)
+    assert not service.errors
+
+
+def test_a_failing_batch_is_dropped(tmp_path, monkeypatch):
+    feed = tmp_path / "counts.jsonl"
+    feed.write_text('{"road": "north", "count": 2}\n')
+    service = IngestService([f"replay:{feed}?speed=1&loop=1"], interval=0.05)
+    add, calls = service.windows.add, []
+
+    def flaky(batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise KeyError(0)
+        return add(batch)
+
+    monkeypatch.setattr(service.windows, "add", flaky)
+    published = _run(service, lambda p: len(calls) > 1 and bool(p))
+    assert service.stats["dropped"] == calls[0]
+    assert published
@@ -0,0 +1,72 @@
+"""LearnedPlanner's latency budget and fallback, alone and in a SharedJunction."""
+
+import time
+
+import numpy as np
+
+from traffic_signal.engine import TimingParams
+from traffic_signal.learned import LearnedPlanner, load_model
+from traffic_signal.shared import SharedJunction
+
+
+def test_single_calls_are_not_budgeted():
+    # One junction per call costs far more than 1 µs of fixed overhead.
+    planner = LearnedPlanner(budget_us=1.0, max_misses=1)
+    for v in range(1, 11):
+        greens, order, cycle = planner((v, 11 - v, 5))
+        assert greens is not None
+    assert not planner.fallback
+
+
+def test_batched_calls_are_budgeted_and_recover():
+    planner = LearnedPlanner(budget_us=0.0, max_misses=2, min_batch=8, retry_s=0.05)
+    vols = np.random.default_rng(0).uniform(1, 10, size=(32, 3))
+    planner.plan_many(vols)
+    planner.plan_many(vols)
+    assert planner.fallback and planner.reason == "over budget"
+    assert planner.plan_many(vols) == (None, None)
+    planner.budget_us = float("inf")
+    time.sleep(0.06)
+    greens, order = planner.plan_many(vols)
+    assert greens is not None and not planner.fallback and planner.reason is None
+
+
+def test_learned_stays_in_use_after_replans():
+    j = SharedJunction("t-learned", TimingParams(start_delay=0.01), planners={"learned": LearnedPlanner()},
+                       tick=0.01)
+    try:
+        assert j.submit("plan_mode", "learned").wait()
+        rng = np.random.default_rng(1)
+        for _ in range(200):
+            vols = dict(zip(("north", "south", "west"), rng.integers(1, 11, size=3).tolist()))
+            assert j.submit("volumes", vols).wait()
+        time.sleep(0.05)
+        snap = j.snapshot()
+        assert snap["planMode"] == "learned"
+        assert snap["planFallback"] is None
+        assert snap["plan"] is not None
+        greens, _ = load_model().predict([[snap["volumes"][r] for r in ("north", "south", "west")]])
+        assert [snap["greens"][r] for r in ("north", "south", "west")] == greens[0].tolist()
+    finally:
+        j.stop()
+
+
+def test_fallback_is_shown_and_retried():
+    planner = LearnedPlanner(budget_us=0.0, max_misses=1, min_batch=1, retry_s=0.05)
+    # A cycle of about 0.3 s, since a junction in fallback asks again once a cycle.
+    fast = TimingParams(min_green=0.05, max_green=0.1, yellow=0.02, all_red=0.01, start_delay=0.01)
+    j = SharedJunction("t-fallback", fast, planners={"learned": planner}, tick=0.01)
+    try:
+        assert j.submit("plan_mode", "learned").wait()
+        assert j.submit("volumes", {"north": 8, "south": 3, "west": 5}).wait()
+        time.sleep(0.05)
+        assert j.snapshot()["planFallback"] == "over budget"
+        assert j.snapshot()["plan"] is None
+        planner.budget_us = float("inf")
+        deadline = time.monotonic() + 5.0
+        while j.snapshot()["planFallback"] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert j.snapshot()["planFallback"] is None
+        assert j.snapshot()["plan"] is not None
+    finally:
+        j.stop()
@@ -0,0 +1,28 @@
+"""SharedJunction: the real-time engine thread and its command queue."""
+
+import time
+
+from traffic_signal.engine import TimingParams
+from traffic_signal.metrics import REGISTRY
+from traffic_signal.shared import SharedJunction
+
+
+def _count(name, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    return REGISTRY._hist.get(key, [None, 0.0, 0])[2]
+
+
+def test_preemption_latencies_are_drained():
+    j = SharedJunction("t-preempt", TimingParams(yellow=0.05, all_red=0.02, start_delay=0.01), tick=0.01)
+    try:
+        before = _count("engine_preemption_seconds", junction="t-preempt")
+        for road in ("west", "south", "north") * 3:
+            assert j.submit("dispatch", road, None).wait()
+            time.sleep(0.15)                       # past yellow + all-red
+            assert j.snapshot()["green"] == road
+            j.submit("clear")
+        time.sleep(0.2)
+        assert j.engine._preemptions == []
+        assert _count("engine_preemption_seconds", junction="t-preempt") > before
+    finally:
+        j.stop()
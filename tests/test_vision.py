@@ -0,0 +1,65 @@
+"""run_config's threading, with the OpenCV decoder replaced by a stub."""
+
+import threading
+
+import numpy as np
+import pytest
+
+from traffic_signal import vision
+
+LANE = [{"lane": 0, "polygon": [[0.2, 0.2], [0.8, 0.2], [0.8, 0.8], [0.2, 0.8]]}]
+CONFIG = {"junction": "t", "interval": 1.0, "start": 0.0,
+          "streams": [{"road": r, "video": f"{r}.mp4", "lanes": LANE} for r in ("north", "south", "west")]}
+
+
+class _Cap:
+    def release(self):
+        pass
+
+
+def _batches(cap, throttle, out, stop):
+    for i in range(8):
+        out.put((i * 0.5, np.zeros((4, 12, 16), dtype=np.uint8)))
+    out.put(None)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(vision, "open_video", lambda path: _Cap())
+    monkeypatch.setattr(vision, "read_batches", _batches)
+
+
+def _within(fn, seconds=10.0):
+    out = {}
+
+    def target():
+        try:
+            out["value"] = fn()
+        except BaseException as exc:
+            out["error"] = exc
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(seconds)
+    assert not t.is_alive(), "run_config hung"
+    if "error" in out:
+        raise out["error"]
+    return out["value"]
+
+
+@pytest.mark.parametrize("workers", [1, 2, None])
+def test_fewer_workers_than_streams(stub, workers):
+    msgs = []
+    jobs = _within(lambda: vision.run_config(CONFIG, msgs.append, workers=workers))
+    assert [j.stats["frames"] for j in jobs] == [32, 32, 32]
+    assert {m["road"] for m in msgs} == {"north", "south", "west"}
+
+
+def test_decoder_failure_is_raised(stub, monkeypatch):
+    def broken(cap, throttle, out, stop):
+        out.put((0.0, np.zeros((4, 12, 16), dtype=np.uint8)))
+        raise OSError("corrupt stream")
+
+    monkeypatch.setattr(vision, "read_batches", broken)
+    with pytest.raises(OSError, match="corrupt stream"):
+        _within(lambda: vision.run_config(CONFIG, lambda m: None))
@@ -0,0 +1,15 @@
+"""
+Traffic Signal
+==============
+Python side of the smart traffic light: the headless signal engine and the
+tooling built on it.  ``app.py`` is the Streamlit front end.
+"""
+
+from .engine import (
+    DEFAULT_TIMING,
+    ROADS,
+    SignalEngine,
+    TimingParams,
+    green_duration,
+    green_durations,
+)
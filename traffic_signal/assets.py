@@ -0,0 +1,206 @@
+"""
+Asset Bundle
+============
+Minified, content-hashed page assets, served from this app's own server.
+
+Sources are ``assets/app.css`` (the Streamlit page theme),
+``traffic_sim_embed.html`` (the simulation page) and any web fonts in
+``assets/fonts``.  ``build()`` writes them to ``assets/dist``:
+
+    app.<hash>.css      theme, with the @font-face rules
+    sim.<hash>.css      the simulation page's <style>, with the same rules
+    sim.<hash>.js       the simulation page's <script>
+    sim.<hash>.html     a shell that links the two
+    <font>.<hash>.woff2
+    manifest.json       logical name → hashed file, plus a digest of the sources
+
+The app registers ``assets/dist`` as a component directory, so Streamlit
+serves it at ``component/<name>/`` with ``Cache-Control: public``.  A
+hashed name changes whenever its content does, so browsers keep each file
+across sessions and reruns.  Only the small HTML shell is revalidated.
+
+Nothing is fetched from outside at startup.  Each @font-face lists the
+installed font first, then the bundled file if ``assets/fonts`` has one
+(``Orbitron-400.woff2``, ``Orbitron-700.woff2``, ``Orbitron-900.woff2``,
+``ShareTechMono-400.woff2``; both families are OFL-licensed).  Without
+either, the browser falls back to the generic monospace.
+
+``load()`` reads the manifest once per process and rebuilds first if the
+sources have changed.  When ``assets/dist`` is not writable, as in a
+read-only install, it builds into ``$XDG_CACHE_HOME/traffic_signal/assets``
+(``~/.cache`` by default) instead.  ``python -m traffic_signal.assets``
+builds ahead of a deploy, so an install that ships ``assets/dist`` never
+needs either.
+"""
+
+import argparse
+import errno
+import hashlib
+import json
+import os
+import pathlib
+import re
+from functools import lru_cache
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+SRC = ROOT / "assets"
+DIST = SRC / "dist"
+CACHE = (pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache")
+         / "traffic_signal" / "assets")              # used when DIST is read-only
+SIM_HTML = ROOT / "traffic_sim_embed.html"
+FONTS = (
+    ("Orbitron", 400, "Orbitron-400.woff2"),
+    ("Orbitron", 700, "Orbitron-700.woff2"),
+    ("Orbitron", 900, "Orbitron-900.woff2"),
+    ("Share Tech Mono", 400, "ShareTechMono-400.woff2"),
+)
+_EXTERNAL = re.compile(r"""<link[^>]+href=["']https?://[^>]*>\s*|@import\s+url\([^)]*\);?\s*""")
+
+
+# ── Minifiers ──────────────────────────────────────────────────────────────────
+def minify_css(css):
+    """Comments and optional whitespace out.  Spaces before ``:`` are kept,
+    since ``a :hover`` and ``a:hover`` are different selectors."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_js(js):
+    """Indentation, blank lines and whole-line ``//`` comments out.  Safe
+    here because no string or template literal spans a line."""
+    lines = (l.strip() for l in js.splitlines())
+    return "\n".join(l for l in lines if l and not l.startswith("//"))
+
+
+def minify_html(html):
+    lines = (l.strip() for l in html.splitlines())
+    return "\n".join(l for l in lines if l and not (l.startswith("<!--") and l.endswith("-->")))
+
+
+# ── Build ──────────────────────────────────────────────────────────────────────
+def _hashed(name, data):
+    stem, ext = name.rsplit(".", 1)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+
+
+def _sources(src=SRC, sim=SIM_HTML):
+    paths = [src / "app.css", sim] + [src / "fonts" / f for _, _, f in FONTS if (src / "fonts" / f).exists()]
+    return sorted(paths)
+
+
+def source_digest(src=SRC, sim=SIM_HTML):
+    h = hashlib.sha256(pathlib.Path(__file__).read_bytes())
+    for p in _sources(src, sim):
+        h.update(p.name.encode() + b"\0" + p.read_bytes())
+    return h.hexdigest()[:16]
+
+
+def font_faces(files):
+    """@font-face rules; ``files`` maps a font file name to its hashed name."""
+    rules = []
+    for family, weight, fname in FONTS:
+        src = [f"local('{family}')"]
+        if fname in files:
+            src.append(f"url('{files[fname]}') format('woff2')")
+        rules.append(f"@font-face{{font-family:'{family}';font-style:normal;font-weight:{weight};"
+                     f"font-display:swap;src:{','.join(src)}}}")
+    return "".join(rules)
+
+
+def build(src=SRC, sim=SIM_HTML, out=DIST):
+    """Write the bundle to ``out``, drop files from older builds, and return
+    the manifest."""
+    out.mkdir(parents=True, exist_ok=True)
+    blobs = {}
+    fonts = {}
+    for _, _, fname in FONTS:
+        p = src / "fonts" / fname
+        if p.exists() and fname not in fonts:
+            data = p.read_bytes()
+            fonts[fname] = _hashed(fname, data)
+            blobs[fonts[fname]] = data
+    faces = font_faces(fonts)
+
+    def add(logical, text):
+        data = text.encode("utf-8")
+        name = _hashed(logical, data)
+        blobs[name] = data
+        return name
+
+    files = {"app.css": add("app.css", faces + minify_css((src / "app.css").read_text(encoding="utf-8")))}
+    page = _EXTERNAL.sub("", sim.read_text(encoding="utf-8"))
+    style = re.search(r"<style>(.*?)</style>", page, re.S)
+    script = re.search(r"<script>(.*?)</script>", page, re.S)
+    files["sim.css"] = add("sim.css", faces + minify_css(style.group(1)))
+    files["sim.js"] = add("sim.js", minify_js(script.group(1)))
+    page = (page[:style.start()] + f'<link rel="stylesheet" href="{files["sim.css"]}">'
+            + page[style.end():script.start()] + f'<script src="{files["sim.js"]}"></script>'
+            + page[script.end():])
+    files["sim.html"] = add("sim.html", minify_html(page))
+    files.update(fonts)
+
+    for name, data in blobs.items():
+        path = out / name
+        if not path.exists():
+            tmp = path.with_name(f".{name}.{os.getpid()}")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+    manifest = {"digest": source_digest(src, sim), "files": files}
+    tmp = out / f".manifest.{os.getpid()}"
+    tmp.write_text(json.dumps(manifest, indent=1))
+    tmp.replace(out / "manifest.json")
+    for p in out.iterdir():
+        if p.is_file() and not p.name.startswith(".") and p.name != "manifest.json" and p.name not in blobs:
+            p.unlink()
+    return manifest
+
+
+def _current(src, sim, out):
+    """The manifest's files if ``out`` holds a build of the current sources."""
+    try:
+        manifest = json.loads((out / "manifest.json").read_text())
+        if manifest["digest"] == source_digest(src, sim) and all(
+                (out / f).exists() for f in manifest["files"].values()):
+            return manifest["files"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+@lru_cache(maxsize=None)
+def load(src=SRC, sim=SIM_HTML, out=DIST, cache=CACHE):
+    """``(directory, {logical name: hashed file})`` for the current sources;
+    read once per process.
+
+    A current build in ``out`` or ``cache`` is used as is.  Otherwise the
+    bundle is built into ``out``, or into ``cache`` if ``out`` cannot be
+    written.  A missing source raises ``FileNotFoundError``.
+    """
+    for d in (out, cache):
+        files = _current(src, sim, d)
+        if files is not None:
+            return d, files
+    try:
+        return out, build(src, sim, out)["files"]
+    except OSError as exc:
+        if exc.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+            raise
+    return cache, build(src, sim, cache)["files"]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.assets",
+                                 description=__doc__.split("\n\n")[0])
+    ap.add_argument("--out", default=str(DIST))
+    args = ap.parse_args(argv)
+    out = pathlib.Path(args.out)
+    manifest = build(out=out)
+    for logical, name in manifest["files"].items():
+        print(f"{logical:28s} {name:40s} {(out / name).stat().st_size:>8,d} B")
+
+
+if __name__ == "__main__":
+    main()
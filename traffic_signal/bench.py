@@ -0,0 +1,461 @@
+"""
+Benchmarks
+==========
+Reproducible timings for the page, the signal engine and emergency
+preemption, compared against a stored baseline.
+
+    python -m traffic_signal.bench run --out runs/bench.json
+    python -m traffic_signal.bench run --only engine preemption
+    python -m traffic_signal.bench run --save-baseline      # after a reviewed change
+
+Four groups:
+
+``app``         ``app.py`` driven by Streamlit's ``AppTest``.  Cold start runs in
+                a fresh interpreter, because ``st.cache_resource`` outlives an
+                ``AppTest`` in the same process.  Then warm reruns, a volume
+                slider move and an emergency dispatch.
+``server``      slider moves sent over the websocket of a real ``streamlit
+                run``, which reruns only the control-panel fragment: time
+                until the engine's new snapshot leaves for the page, time to
+                the end of the rerun, and server CPU per move.  Then 1 and
+                50 idle pages polling the ``run_every`` fragments: server
+                CPU, fragment runs per second and bytes sent per session.
+``engine``      ``SignalEngine.advance`` steps per second at the shared
+                engine's 50 ms tick, per junction count × volume profile.
+``preemption``  simulated seconds from dispatch to forced green at random
+                points in the cycle, and the wall-clock submit → applied
+                latency of a dispatch through ``SharedJunction``.
+
+Every metric records whether lower or higher is better.  ``run`` exits with
+status 1 when any metric is worse than the baseline by more than
+``--threshold`` (default 25 %).  Wall-clock timings take the median of
+repeats, engine throughput the best repeat.  Simulated metrics are seeded,
+so they only move when the controller's behaviour changes.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from .engine import DEFAULT_TIMING, ROADS, SignalEngine
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+APP_PATH = ROOT / "app.py"
+BASELINE_PATH = ROOT / "benchmarks" / "baseline.json"
+THRESHOLD = 0.25
+TICK = 0.05                       # s, SharedJunction's engine tick
+JUNCTIONS = (1, 100, 10_000)
+PROFILES = {
+    "light": (2, 2, 1),
+    "balanced": (5, 5, 5),
+    "heavy": (10, 9, 8),
+    "mixed": None,                # uniform 1–10 per junction and road
+}
+
+
+def metric(value, unit, better, tolerance=None):
+    """One result; ``tolerance`` overrides ``--threshold`` for jittery metrics."""
+    m = {"value": float(value), "unit": unit, "better": better}
+    if tolerance is not None:
+        m["tolerance"] = tolerance
+    return m
+
+
+def _times(fn, repeat):
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _median_time(fn, repeat):
+    return statistics.median(_times(fn, repeat))
+
+
+# ── App ────────────────────────────────────────────────────────────────────────
+_COLD = """
+import time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({path!r}, default_timeout=60)
+t0 = time.perf_counter()
+at.run()
+assert not at.exception, at.exception
+print(time.perf_counter() - t0)
+"""
+
+
+def bench_app(repeat=5):
+    from streamlit.testing.v1 import AppTest
+
+    cold = statistics.median(
+        float(subprocess.run([sys.executable, "-c", _COLD.format(path=str(APP_PATH))], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.split()[-1])
+        for _ in range(max(1, repeat // 2)))
+    at = AppTest.from_file(str(APP_PATH), default_timeout=60)
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"app.py raised: {at.exception}")
+    warm = _median_time(at.run, repeat)
+
+    def slider():
+        s = at.slider(key="sl_north")
+        s.set_value(s.value % 10 + 1).run()
+
+    def dispatch():
+        at.button(key="qw").click().run()
+        at.button(key="btn_clear").click().run()
+
+    return {
+        "app.cold_start_s": metric(cold, "s", "lower"),
+        "app.warm_rerun_s": metric(warm, "s", "lower"),
+        "app.slider_rerun_s": metric(_median_time(slider, repeat), "s", "lower"),
+        "app.dispatch_clear_s": metric(_median_time(dispatch, repeat), "s", "lower"),
+    }
+
+
+# ── Engine ─────────────────────────────────────────────────────────────────────
+def _engine(n, profile, seed=0):
+    vols = PROFILES[profile]
+    if vols is None:
+        vols = np.random.default_rng(seed).integers(1, 11, size=(n, len(ROADS)))
+    eng = SignalEngine(n, DEFAULT_TIMING, volumes=vols)
+    eng.advance(60.0)                                  # past the start delay, phases spread
+    return eng
+
+
+def bench_engine(junctions=JUNCTIONS, profiles=tuple(PROFILES), sim_seconds=300.0, repeat=7):
+    """Steps per second of ``advance(TICK)`` over ``sim_seconds`` of simulated
+    time, best of ``repeat``: small junction counts are dominated by
+    per-call overhead, where the median still moves with machine load."""
+    steps = int(sim_seconds / TICK)
+    out = {}
+    for n in junctions:
+        for profile in profiles:
+            def run():
+                eng = _engine(n, profile)
+                for _ in range(steps):
+                    eng.advance(TICK)
+            rate = steps / min(_times(run, repeat))
+            out[f"engine.steps_per_s[n={n},{profile}]"] = metric(rate, "steps/s", "higher")
+    return out
+
+
+# ── Preemption ─────────────────────────────────────────────────────────────────
+def bench_preemption(junctions=10_000, rounds=20, seed=0, commands=200):
+    """Dispatch a random road on every junction each round, at random cycle
+    points; latency is simulated seconds to the emergency green."""
+    rng = np.random.default_rng(seed)
+    eng = SignalEngine(junctions, DEFAULT_TIMING,
+                       volumes=rng.integers(1, 11, size=(junctions, len(ROADS))))
+    eng.advance(60.0)
+    idx = np.arange(junctions)
+    lat = []
+    for _ in range(rounds):
+        eng.advance(float(rng.uniform(0, 60)))
+        road = rng.integers(0, len(ROADS), size=junctions)
+        for r in range(len(ROADS)):
+            eng.dispatch(idx[road == r], ROADS[r])
+        eng.advance(30.0)
+        lat.append(eng.preemption_latencies())
+        eng.clear_emergency(idx)
+    lat = np.concatenate(lat)
+
+    from .shared import SharedJunction
+    junction = SharedJunction("bench", DEFAULT_TIMING)
+    wall = []
+    try:
+        for i in range(commands):
+            t0 = time.perf_counter()
+            junction.submit("dispatch", ROADS[i % len(ROADS)], None)
+            wall.append(time.perf_counter() - t0)
+            junction.submit("clear")
+    finally:
+        junction.stop()
+    wall = np.array(wall) * 1e3
+    return {
+        "preemption.sim_mean_s": metric(lat.mean(), "s", "lower"),
+        "preemption.sim_p50_s": metric(np.percentile(lat, 50), "s", "lower"),
+        "preemption.sim_p99_s": metric(np.percentile(lat, 99), "s", "lower"),
+        "preemption.sim_max_s": metric(lat.max(), "s", "lower"),
+        "preemption.served_fraction": metric(lat.size / (rounds * junctions), "", "higher"),
+        # Thread hand-off time: scheduler noise dominates, so only a doubling counts.
+        "preemption.command_p50_ms": metric(np.percentile(wall, 50), "ms", "lower", 1.0),
+        "preemption.command_p99_ms": metric(np.percentile(wall, 99), "ms", "lower", 1.0),
+    }
+
+
+# ── Server ─────────────────────────────────────────────────────────────────────
+def _cpu_s(pid):
+    """User + system CPU seconds of ``pid`` from /proc (None elsewhere)."""
+    try:
+        fields = pathlib.Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def _drive(port, moves):
+    """One browser session over Streamlit's websocket: a full run, then
+    ``moves`` north-slider changes.  Returns ``[(first_s, done_s, fragment)]``
+    per move: seconds to the first element sent back (the simulation
+    messenger, by then the engine has applied the change), seconds to the end
+    of the run, and whether the server reran only a fragment."""
+    import websockets
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    async with websockets.connect(f"ws://127.0.0.1:{port}/_stcore/stream",
+                                  subprotocols=["streamlit"], max_size=None) as ws:
+        async def rerun(widget=None, value=None, fragment=""):
+            m = BackMsg()
+            m.rerun_script.query_string = ""
+            if widget:
+                w = m.rerun_script.widget_states.widgets.add()
+                w.id = widget
+                w.double_array_value.data.append(value)
+                m.rerun_script.fragment_id = fragment
+            t0 = time.perf_counter()
+            await ws.send(m.SerializeToString())
+            found = first = None
+            while True:
+                f = ForwardMsg()
+                f.ParseFromString(await asyncio.wait_for(ws.recv(), 60))
+                kind = f.WhichOneof("type")
+                if kind == "delta" and first is None:
+                    first = time.perf_counter() - t0
+                if kind == "delta" and f.delta.WhichOneof("type") == "new_element":
+                    el = f.delta.new_element
+                    if el.WhichOneof("type") == "slider" and el.slider.id.endswith("sl_north"):
+                        found = (el.slider.id, f.delta.fragment_id)
+                elif kind == "script_finished":
+                    return found, first, time.perf_counter() - t0
+
+        (widget, fragment), _, _ = await rerun()
+        out = []
+        for i in range(moves):
+            _, first, done = await rerun(widget, float(i % 10 + 1), fragment)
+            out.append((first, done, bool(fragment)))
+        return out
+
+
+async def _poll(port, sessions, seconds, pid):
+    """``sessions`` idle browser sessions: a full run each, then ``seconds``
+    of the fragment reruns a browser sends for ``run_every``.  Measured from
+    the moment every session is open, so opening them is not counted.
+    Returns fragment runs per second, bytes sent per session per second and
+    the server's CPU seconds per second (None off Linux)."""
+    import websockets
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    runs = sent = opened = 0
+    start = end = cpu0 = None
+    all_open = asyncio.Event()
+
+    async def session():
+        nonlocal runs, sent, opened, start, end, cpu0
+        # No keepalive pings: a saturated server answers them late, and that
+        # is what is being measured, not a dead peer.
+        async with websockets.connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"],
+                                      max_size=None, ping_interval=None) as ws:
+            async def rerun(fragment=""):
+                nonlocal sent
+                m = BackMsg()
+                m.rerun_script.query_string = ""
+                m.rerun_script.fragment_id = fragment
+                await ws.send(m.SerializeToString())
+                timers = {}
+                while True:
+                    data = await asyncio.wait_for(ws.recv(), 120)
+                    sent += len(data)
+                    f = ForwardMsg()
+                    f.ParseFromString(data)
+                    kind = f.WhichOneof("type")
+                    if kind == "auto_rerun":
+                        timers[f.auto_rerun.fragment_id] = f.auto_rerun.interval
+                    elif kind == "script_finished":
+                        return timers
+
+            timers = await rerun()
+            opened += 1
+            if opened == sessions:                     # the last one starts the clock
+                runs = sent = 0
+                cpu0, start = _cpu_s(pid), time.perf_counter()
+                end = start + seconds
+                all_open.set()
+            await all_open.wait()
+            due = {fid: start + every for fid, every in timers.items()}
+            while True:
+                fid = min(due, key=due.get)
+                if due[fid] > end:
+                    return
+                await asyncio.sleep(max(due[fid] - time.perf_counter(), 0))
+                await rerun(fid)
+                runs += 1
+                # A browser's timer does not queue missed ticks either.
+                due[fid] = max(due[fid] + timers[fid], time.perf_counter())
+
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    span = time.perf_counter() - start
+    cpu = _cpu_s(pid)
+    return runs / span, sent / span / sessions, None if cpu0 is None else (cpu - cpu0) / span
+
+
+def bench_server(moves=30, app_path=APP_PATH, sessions=(1, 50), seconds=20.0):
+    """Slider moves against a real ``streamlit run``, as a browser sends
+    them: wall latency and server CPU per move (Linux).  ``AppTest`` cannot
+    rerun a fragment on its own, so this is the only measure of the control
+    panel's fragment path.
+
+    Then the steady cost of open pages: ``sessions`` browsers that only poll
+    the ``run_every`` fragments, as server CPU (% of one core) and bytes
+    sent per session per second."""
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, "-m", "streamlit", "run", str(app_path),
+                             "--server.headless", "true", "--server.port", str(port),
+                             "--browser.gatherUsageStats", "false"],
+                            cwd=pathlib.Path(app_path).parent,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                time.sleep(0.2)
+        asyncio.run(_drive(port, 3))                   # warm caches and imports
+        cpu0, t0 = _cpu_s(proc.pid), time.perf_counter()
+        moves_ = asyncio.run(_drive(port, moves))
+        cpu1, busy = _cpu_s(proc.pid), time.perf_counter() - t0
+        time.sleep(busy)                               # same span idle: engine thread, timers
+        idle = _cpu_s(proc.pid)
+        polls = {n: asyncio.run(_poll(port, n, seconds, proc.pid)) for n in sessions}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    first = np.array([m[0] for m in moves_]) * 1e3
+    done = np.array([m[1] for m in moves_]) * 1e3
+    out = {
+        "server.slider_applied_p50_ms": metric(np.percentile(first, 50), "ms", "lower"),
+        "server.slider_applied_p90_ms": metric(np.percentile(first, 90), "ms", "lower"),
+        "server.slider_rerun_p50_ms": metric(np.percentile(done, 50), "ms", "lower"),
+        "server.slider_rerun_p90_ms": metric(np.percentile(done, 90), "ms", "lower"),
+    }
+    if cpu0 is not None:
+        # Less the idle process over the same span.  The session's first full
+        # run is included, spread over the moves.
+        cpu = (cpu1 - cpu0) - (idle - cpu1)
+        out["server.slider_cpu_ms"] = metric(cpu * 1e3 / moves, "ms", "lower")
+    for n, (runs, sent, cpu) in polls.items():
+        out[f"server.poll_runs_per_s[sessions={n}]"] = metric(runs, "1/s", "lower")
+        out[f"server.poll_kb_per_session_s[sessions={n}]"] = metric(sent / 1e3, "kB", "lower", tolerance=1.0)
+        if cpu is not None:
+            idle_rate = (idle - cpu1) / busy
+            out[f"server.poll_cpu_pct[sessions={n}]"] = metric((cpu - idle_rate) * 100, "%", "lower",
+                                                               tolerance=1.0)
+    return out
+
+
+GROUPS = {"app": bench_app, "server": bench_server, "engine": bench_engine,
+          "preemption": bench_preemption}
+
+
+# ── Results ────────────────────────────────────────────────────────────────────
+def run(groups=tuple(GROUPS), log=None):
+    results = {}
+    for name in groups:
+        if log:
+            log(f"{name}…\n")
+        results.update(GROUPS[name]())
+    return {
+        "meta": {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "commit": _commit(),
+        },
+        "results": results,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """``[(name, value, base, change, regressed)]`` for every metric in both;
+    ``change`` is relative to the baseline and ``regressed`` says whether it
+    moved the worse way by more than the metric's tolerance."""
+    rows = []
+    for name, m in results["results"].items():
+        b = baseline["results"].get(name)
+        if b is None or not b["value"]:
+            continue
+        change = (m["value"] - b["value"]) / abs(b["value"])
+        worse = -change if m["better"] == "higher" else change
+        rows.append((name, m["value"], b["value"], change, worse > m.get("tolerance", threshold)))
+    return rows
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.bench",
+                                 description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("run", help="run benchmarks and compare with the baseline")
+    p.add_argument("--only", nargs="+", choices=list(GROUPS), default=list(GROUPS))
+    p.add_argument("--out", help="write results JSON here")
+    p.add_argument("--baseline", default=str(BASELINE_PATH))
+    p.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed relative regression")
+    p.add_argument("--save-baseline", action="store_true",
+                   help="merge these results into the baseline instead of comparing")
+    args = ap.parse_args(argv)
+
+    res = run(args.only, log=lambda s: print(s, end="", file=sys.stderr, flush=True))
+    if args.out:
+        pathlib.Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        pathlib.Path(args.out).write_text(json.dumps(res, indent=1))
+    base_path = pathlib.Path(args.baseline)
+
+    if args.save_baseline:
+        base = json.loads(base_path.read_text()) if base_path.exists() else {"results": {}}
+        base["meta"] = res["meta"]
+        base["results"].update(res["results"])
+        base_path.parent.mkdir(parents=True, exist_ok=True)
+        base_path.write_text(json.dumps(base, indent=1, sort_keys=True) + "\n")
+        print(f"{len(res['results'])} metrics → {base_path}")
+        return 0
+
+    base = json.loads(base_path.read_text()) if base_path.exists() else {"results": {}}
+    worse = 0
+    for name, value, b, change, regressed in sorted(compare(res, base, args.threshold)):
+        worse += regressed
+        print(f"{name:44s} {value:14.4g} {b:14.4g} {change:+8.1%} {'REGRESSED' if regressed else ''}")
+    for name in sorted(res["results"].keys() - base["results"].keys()):
+        print(f"{name:44s} {res['results'][name]['value']:14.4g} {'(new)':>14s}")
+    if worse:
+        print(f"{worse} metric(s) worse than the baseline by more than their tolerance")
+    return 1 if worse else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Detector Ingestion
+==================
+Streams per-lane vehicle counts into the shared junction engines.
+
+Detectors send JSON lines::
+
+    {"junction": "main", "road": "north", "lane": 0, "count": 3, "t": 1718000000.5}
+
+``junction`` defaults to ``main``, ``lane`` is informational (lanes are summed
+per road), ``count`` defaults to 1 and ``t`` (epoch seconds) to the arrival
+time.  A line whose ``road`` is not a road name, or whose ``count`` or ``t``
+is not a finite number (``count`` also ≥ 0), is counted as bad and dropped.
+Sources:
+
+``tcp://HOST:PORT``          line server; any number of detector connections
+``pipe:/path/to/fifo``       named pipe, reopened whenever the writer closes it
+``replay:counts.jsonl``      a recorded feed, paced by its own ``t`` values;
+                             ``?speed=10`` plays faster, ``&loop=1`` repeats
+
+Counts land in per-junction sliding windows (1 s bins).  Every ``interval``
+the arrival rate per road is mapped onto the 1–10 volume scale with the
+simulation's own spawn model, so volume ``v`` means the page would spawn the
+observed flow.  Readers feed one bounded queue, so a flood of messages slows
+the readers instead of growing memory; each publish only keeps the latest
+volumes per junction, so the engines see at most one update per interval.
+
+    python -m traffic_signal.ingest replay:counts.jsonl?speed=20
+
+prints the volumes it would publish.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from .des import DEFAULT_DEMAND
+from .engine import ROAD_INDEX, ROADS
+
+log = logging.getLogger(__name__)
+
+VOL_MIN, VOL_MAX = 1.0, 10.0
+
+
+# ── Sliding windows ────────────────────────────────────────────────────────────
+class CountWindows:
+    """Per-junction, per-road counts over the last ``window`` seconds.
+
+    All junctions share one (J, bins, 3) ring indexed by the absolute bin
+    number, so ageing out a second of counts is one slice assignment for every
+    junction at once.
+    """
+
+    def __init__(self, window=60.0, bin_s=1.0):
+        self.bin_s = float(bin_s)
+        self.nbins = max(1, int(round(window / bin_s)))
+        self.window = self.nbins * self.bin_s
+        self.ids = {}                                  # junction id → row
+        self.counts = np.zeros((0, self.nbins, len(ROADS)))
+        self.total = np.zeros((0, len(ROADS)))
+        self.first = np.zeros(0)                       # first count per junction
+        self.last = np.zeros(0)                        # latest count per junction
+        self.head = None                               # newest absolute bin
+
+    def row(self, junction):
+        r = self.ids.get(junction)
+        if r is None:
+            r = self.ids[junction] = len(self.ids)
+            k = len(ROADS)
+            self.counts = np.concatenate([self.counts, np.zeros((1, self.nbins, k))])
+            self.total = np.concatenate([self.total, np.zeros((1, k))])
+            self.first = np.append(self.first, np.nan)
+            self.last = np.append(self.last, np.nan)
+        return r
+
+    def advance(self, now):
+        """Drop bins that fell out of the window ending at ``now``."""
+        b = int(now // self.bin_s)
+        if self.head is None:
+            self.head = b
+            return
+        if b <= self.head:
+            return
+        stale = np.arange(self.head + 1, min(b, self.head + self.nbins) + 1) % self.nbins
+        self.total -= self.counts[:, stale].sum(axis=1)
+        self.counts[:, stale] = 0
+        self.head = b
+
+    def add(self, batch):
+        """Count a batch of ``(junction, road, count, t)`` messages; the window
+        must already be advanced to the newest ``t``.  Returns how many fell
+        outside it."""
+        rows = np.fromiter((self.row(m[0]) for m in batch), np.int64, len(batch))
+        roads = np.fromiter((ROAD_INDEX[m[1]] for m in batch), np.int64, len(batch))
+        count = np.fromiter((m[2] for m in batch), np.float64, len(batch))
+        t = np.fromiter((m[3] for m in batch), np.float64, len(batch))
+        b = (t // self.bin_s).astype(np.int64)
+        ok = (self.head is not None) & (b <= self.head) & (b > (self.head or 0) - self.nbins)
+        rows, roads, count, t, b = rows[ok], roads[ok], count[ok], t[ok], b[ok]
+        np.add.at(self.counts, (rows, b % self.nbins, roads), count)
+        np.add.at(self.total, (rows, roads), count)
+        np.fmin.at(self.first, rows, t)
+        np.fmax.at(self.last, rows, t)
+        return int((~ok).sum())
+
+    def rates(self, now):
+        """Vehicles per second per road, as a (J, 3) array.
+
+        A junction that has been reporting for less than a full window is
+        averaged over the time it has been reporting.
+        """
+        span = np.clip(now - self.first, self.bin_s, self.window)
+        with np.errstate(invalid="ignore"):
+            return np.where(np.isnan(span)[:, None], 0.0, self.total / span[:, None])
+
+
+def rate_to_volume(rate, demand=DEFAULT_DEMAND):
+    """Arrival rate (veh/s) → volume on the 1–10 scale, inverting the page's
+    ``vol/10 * 0.35`` spawns per 1.2 s, rounded to 0.1."""
+    v = np.asarray(rate) * 10 * demand.spawn_every / demand.spawn_scale
+    return np.round(np.clip(v, VOL_MIN, VOL_MAX), 1)
+
+
+# ── Sources ────────────────────────────────────────────────────────────────────
+def parse_message(line, now):
+    """``(junction, road, count, t)`` from one JSON line, or None.  ``now``
+    stands in for a missing ``t``; it may be ``inf`` (unpaced replay)."""
+    try:
+        d = json.loads(line)
+        road = d["road"]
+        count = float(d.get("count", 1))
+        t = float(d["t"]) if "t" in d else now
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if not (isinstance(road, str) and road in ROAD_INDEX and math.isfinite(count) and count >= 0
+            and ("t" not in d or math.isfinite(t))):
+        return None
+    return str(d.get("junction", "main")), road, count, min(t, now)
+
+
+async def _read_lines(reader, queue, stats):
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        msg = parse_message(line, time.time())
+        if msg is None:
+            stats["bad"] += 1
+            continue
+        stats["received"] += 1
+        await queue.put(msg)                           # blocks the reader when full
+
+
+async def tcp_source(host, port, queue, stats):
+    async def client(reader, writer):
+        try:
+            await _read_lines(reader, queue, stats)
+        finally:
+            writer.close()
+    server = await asyncio.start_server(client, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def pipe_source(path, queue, stats):
+    loop = asyncio.get_running_loop()
+    while True:
+        # O_NONBLOCK: opening a FIFO for reading must not wait for a writer.
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        reader = asyncio.StreamReader(loop=loop)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", buffering=0))
+        try:
+            await _read_lines(reader, queue, stats)
+        finally:
+            transport.close()
+        await asyncio.sleep(0.1)                       # writer went away; wait for the next
+
+
+async def replay_source(path, queue, stats, speed=1.0, loop=False):
+    """Play a recorded feed in real time (÷ ``speed``), restamped to now."""
+    while True:
+        t0 = wall0 = None
+        with open(path, "rb") as f:
+            for line in f:
+                msg = parse_message(line, math.inf)
+                if msg is None:
+                    stats["bad"] += 1
+                    continue
+                t = msg[3]
+                if math.isfinite(t):                   # lines without ``t`` are not paced
+                    if t0 is None:
+                        t0, wall0 = t, time.monotonic()
+                    delay = wall0 + (t - t0) / speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                stats["received"] += 1
+                await queue.put(msg[:3] + (time.time(),))
+        if not loop:
+            return
+
+
+def open_source(spec, queue, stats):
+    """Coroutine for one ``tcp://``, ``pipe:`` or ``replay:`` source."""
+    u = urlsplit(spec)
+    opts = {k: v[-1] for k, v in parse_qs(u.query).items()}
+    if u.scheme == "tcp":
+        return tcp_source(u.hostname or "0.0.0.0", u.port, queue, stats)
+    if u.scheme == "pipe":
+        return pipe_source(u.path, queue, stats)
+    if u.scheme == "replay":
+        return replay_source(u.path, queue, stats, float(opts.get("speed", 1.0)),
+                             opts.get("loop", "0") not in ("0", "false", ""))
+    raise ValueError(f"unknown detector source {spec!r}")
+
+
+# ── Service ────────────────────────────────────────────────────────────────────
+class IngestService:
+    """Runs the sources on an asyncio loop in a background thread.
+
+    ``attach(junction)`` connects a ``shared.SharedJunction``; its volumes are
+    then driven by the feed for that junction id.  ``sink(junction_id,
+    volumes)`` is called as well, for other consumers.
+    """
+
+    def __init__(self, sources, window=60.0, interval=0.25, queue_size=10_000,
+                 sink=None, demand=DEFAULT_DEMAND, stale_after=None):
+        self.sources = list(sources)
+        self.windows = CountWindows(window)
+        self.interval = interval
+        self.queue_size = queue_size
+        self.sink = sink
+        self.demand = demand
+        self.stale_after = window if stale_after is None else stale_after
+        self.latest = {}                               # junction id → {road: volume}
+        self.stats = {"received": 0, "bad": 0, "late": 0, "dropped": 0, "published": 0}
+        self.errors = []                               # (source, exception) of failed sources
+        self._junctions = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+        self._thread = None
+
+    # ── Control ───────────────────────────────────
+    def start(self):
+        self._thread = threading.Thread(target=self._main, name="detector-ingest", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def attach(self, junction):
+        with self._lock:
+            if self._junctions.get(junction.junction_id) is junction:
+                return
+            self._junctions[junction.junction_id] = junction
+            vols = self.latest.get(junction.junction_id)
+        if vols is not None:
+            junction.submit("volumes", vols, wait=False)
+
+    def is_live(self, junction_id):
+        """Whether the junction had a count within ``stale_after`` seconds."""
+        r = self.windows.ids.get(junction_id)
+        return r is not None and time.time() - self.windows.last[r] <= self.stale_after
+
+    # ── Loop ──────────────────────────────────────
+    def _main(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._task = self._loop.create_task(self._serve())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass                                       # stop()
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        queue = asyncio.Queue(self.queue_size)
+        tasks = [asyncio.ensure_future(self._guard(s, queue)) for s in self.sources]
+        tasks.append(asyncio.ensure_future(self._aggregate(queue)))
+        tasks.append(asyncio.ensure_future(self._publish_every()))
+        await asyncio.gather(*tasks)
+
+    async def _guard(self, spec, queue):
+        # One broken source must not take the others down.
+        try:
+            await open_source(spec, queue, self.stats)
+        except Exception as exc:
+            self.errors.append((spec, exc))
+
+    async def _aggregate(self, queue):
+        w = self.windows
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < 4096:
+                batch.append(queue.get_nowait())
+            w.advance(time.time())
+            # One bad batch must not end the task, and with it the service.
+            try:
+                self.stats["late"] += w.add(batch)
+            except Exception:
+                log.exception("dropped a batch of %d detector messages", len(batch))
+                self.stats["dropped"] += len(batch)
+
+    async def _publish_every(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.publish(time.time())
+
+    def publish(self, now):
+        """Recompute every junction's volumes; forward the ones that changed."""
+        w = self.windows
+        w.advance(now)
+        if not w.ids:
+            return
+        vols = rate_to_volume(w.rates(now), self.demand)
+        for junction_id, r in list(w.ids.items()):
+            v = dict(zip(ROADS, vols[r].tolist()))
+            if self.latest.get(junction_id) == v:
+                continue
+            with self._lock:
+                self.latest[junction_id] = v
+                target = self._junctions.get(junction_id)
+            self.stats["published"] += 1
+            if target is not None:
+                target.submit("volumes", v, wait=False)
+            if self.sink is not None:
+                self.sink(junction_id, v)
+
+
+def parse_sources(value):
+    """Comma-separated source list, e.g. from ``TRAFFIC_DETECTORS``."""
+    return [s.strip() for s in (value or "").split(",") if s.strip()]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.ingest",
+                                 description=__doc__.split("\n\n")[0])
+    ap.add_argument("sources", nargs="+", help="tcp://HOST:PORT, pipe:PATH or replay:FILE[?speed=N&loop=1]")
+    ap.add_argument("--window", type=float, default=60.0, help="sliding window, seconds")
+    ap.add_argument("--interval", type=float, default=0.25, help="publish interval, seconds")
+    args = ap.parse_args(argv)
+
+    def show(junction_id, v):
+        print(f"{time.strftime('%H:%M:%S')} {junction_id:>12}  "
+              + "  ".join(f"{r[0].upper()} {v[r]:4.1f}" for r in ROADS), flush=True)
+
+    svc = IngestService(args.sources, args.window, args.interval, sink=show).start()
+    try:
+        svc._thread.join()
+    except KeyboardInterrupt:
+        svc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Latency Histograms
+==================
+Fixed-bucket latency histograms and the emergency-preemption timing log.
+
+A dispatch is stamped at four points, all in epoch milliseconds:
+
+``click``     operator presses a dispatch button (browser clock)
+``received``  the dispatch callback runs on the server (server clock)
+``ack``       the shared engine thread applies the dispatch (server clock,
+              ``SharedJunction._execute``)
+``green``     the emergency road turns green on screen (browser clock)
+
+``received → ack`` is measured on the server clock alone and ``click →
+green`` on the browser clock alone, so neither includes clock skew.
+``click → received`` and ``ack → green`` each start on one clock and end on
+the other, so any offset between browser and server is added to them (with
+opposite signs, which is why the two still sum correctly across the
+end-to-end span).
+"""
+
+import threading
+import time
+import uuid
+
+import numpy as np
+
+STAGES = ("click", "received", "ack", "green")
+SPANS = (("click", "received"), ("received", "ack"), ("ack", "green"), ("click", "green"))
+
+
+def now_ms():
+    return time.time() * 1000.0
+
+
+# ── Histogram ──────────────────────────────────────────────────────────────────
+class LatencyHistogram:
+    """Log-spaced buckets from ``lo`` to ``hi`` seconds, plus under/overflow.
+
+    Recording is a ``searchsorted`` into fixed edges, so memory never grows and
+    histograms from different processes can be summed bucket by bucket.
+    """
+
+    def __init__(self, lo=1e-4, hi=100.0, per_decade=10):
+        decades = np.log10(hi) - np.log10(lo)
+        self.edges = np.logspace(np.log10(lo), np.log10(hi), int(round(decades * per_decade)) + 1)
+        self.counts = np.zeros(self.edges.size + 1, dtype=np.int64)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        s = np.atleast_1d(np.asarray(seconds, dtype=np.float64))
+        s = s[np.isfinite(s)]
+        bins = np.searchsorted(self.edges, s, side="right")
+        with self._lock:
+            np.add.at(self.counts, bins, 1)
+            self.total += float(s.sum())
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def quantile(self, q):
+        """Upper edge of the bucket holding quantile ``q`` (NaN when empty)."""
+        n = self.count
+        if not n:
+            return float("nan")
+        i = int(np.searchsorted(np.cumsum(self.counts), q * n, side="left"))
+        return float(self.edges[min(i, self.edges.size - 1)])
+
+    def mean(self):
+        n = self.count
+        return self.total / n if n else float("nan")
+
+    def buckets(self):
+        """``(upper_edges, counts)`` for the non-empty range, for charts."""
+        nz = np.flatnonzero(self.counts)
+        if not nz.size:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        lo, hi = nz[0], nz[-1] + 1
+        upper = np.append(self.edges, np.inf)
+        return upper[lo:hi], self.counts[lo:hi].copy()
+
+
+# ── Preemption log ─────────────────────────────────────────────────────────────
+class PreemptionLog:
+    """Open dispatches and per-span latency histograms, shared across sessions."""
+
+    def __init__(self, max_open=256):
+        self.max_open = max_open
+        self.spans = {f"{a}→{b}": LatencyHistogram() for a, b in SPANS}
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def received(self, road, click_ms=None):
+        """Register a dispatch on arrival at the server; returns its stamp dict."""
+        stamp = {"id": uuid.uuid4().hex[:12], "road": road, "receivedAt": now_ms()}
+        if click_ms is not None:
+            stamp["clickAt"] = click_ms
+        with self._lock:
+            if len(self._open) >= self.max_open:        # drop the oldest, unreported
+                self._open.pop(next(iter(self._open)))
+            self._open[stamp["id"]] = dict(stamp)
+        return stamp
+
+    def report(self, sample):
+        """Merge client-side stamps (``clickAt`` / ``ackAt`` / ``greenAt``).
+
+        Once ``greenAt`` is known the dispatch is closed and its spans are
+        recorded.  Unknown or already-closed ids are ignored, so replaying the
+        same report is harmless.
+        """
+        with self._lock:
+            rec = self._open.get(sample.get("id"))
+            if rec is None:
+                return False
+            for k in ("clickAt", "ackAt", "greenAt"):
+                if sample.get(k) is not None:
+                    rec[k] = sample[k]
+            if "greenAt" not in rec:
+                return False
+            del self._open[rec["id"]]
+        at = {s: rec.get(f"{s}At") for s in STAGES}
+        for a, b in SPANS:
+            if at[a] is not None and at[b] is not None:
+                self.spans[f"{a}→{b}"].record((at[b] - at[a]) / 1000.0)
+        return True
+
+    def summary(self):
+        """``{span: {count, p50, p95, max_bucket}}`` in seconds."""
+        out = {}
+        for name, h in self.spans.items():
+            upper, _ = h.buckets()
+            out[name] = {
+                "count": h.count,
+                "p50": h.quantile(0.5),
+                "p95": h.quantile(0.95),
+                "max_bucket": float(upper[-1]) if upper.size else float("nan"),
+            }
+        return out
@@ -0,0 +1,276 @@
+"""
+Learned Greens
+==============
+Green durations and service order from a small regression model trained
+offline on the event-driven simulator.
+
+Training searches timing plans for a grid of volume triples with
+``des.JunctionDES``.  Each candidate stretches or shrinks the Webster cycle
+and reshapes its split.  The plan with the lowest delay is the target, and
+delay here is queued vehicle-seconds per served vehicle, so vehicles left
+waiting on a starved road count against a plan.  A ridge regression on a
+few features of the volumes, with weights shared by the three roads, then
+learns that mapping:
+
+    python -m traffic_signal.learned train --out traffic_signal/green_model.json
+    python -m traffic_signal.learned eval
+
+At run time ``load_model()`` reads the weights once per process.
+``LearnedPlanner.plan_many`` scores any number of junctions in one array
+expression.  Queue estimates, when given, raise a road's effective volume
+by the rate needed to clear the queue within ``QUEUE_HORIZON``.  Every call
+is timed per decision.  If the model is missing, its output is not finite,
+or batched calls keep running over ``budget_us`` per junction, the planner
+falls back to the linear ramp with highest-volume-next, and tries the model
+again after ``retry_s``.  Fallback state belongs to one planner, so each
+caller (a shared junction, a network region) should hold its own.
+"""
+
+import argparse
+import itertools
+import json
+import pathlib
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from .des import DEFAULT_DEMAND, JunctionDES
+from .engine import DEFAULT_TIMING, ROADS
+from .ingest import rate_to_volume
+from .plans import webster
+
+MODEL_PATH = pathlib.Path(__file__).with_name("green_model.json")
+QUEUE_HORIZON = 300.0             # s to clear a queue estimate
+MAX_GREEN = 60.0                  # s, upper clamp on a predicted green
+SCALES = (0.4, 0.55, 0.7, 0.85, 1.0, 1.25)        # × Webster cycle
+TILTS = (0.0, 0.5, 1.0, 1.5)                      # split ∝ flow ratio ** tilt
+TRAIN_VOLUMES = (1, 3, 5, 7, 10)
+
+
+# ── Features ───────────────────────────────────────────────────────────────────
+def features(volumes):
+    """(N, 3, F) features per road: its own volume and the junction totals,
+    so one weight vector serves every road."""
+    v = np.asarray(volumes, dtype=np.float64) / 10
+    tot = v.sum(axis=-1, keepdims=True)
+    sq = (v * v).sum(axis=-1, keepdims=True)
+    one = np.ones_like(v)
+    return np.stack([one, v, v * v, np.broadcast_to(tot, v.shape),
+                     np.broadcast_to(sq, v.shape), v * tot], axis=-1)
+
+
+# ── Model ──────────────────────────────────────────────────────────────────────
+class GreenModel:
+    """Ridge weights for ``greens = features(volumes) @ w``."""
+
+    def __init__(self, weights, timing=DEFAULT_TIMING, meta=None):
+        self.w = np.asarray(weights, dtype=np.float64)
+        self.timing = timing
+        self.meta = meta or {}
+
+    def predict(self, volumes):
+        """Greens (N, 3) in seconds and order (N, 3), busiest road first."""
+        v = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+        greens = np.clip(features(v) @ self.w, self.timing.min_green, MAX_GREEN)
+        order = np.argsort(-v, axis=-1, kind="stable").astype(np.int8)
+        return np.round(greens, 1), order
+
+    @classmethod
+    def fit(cls, volumes, greens, ridge=1e-3, **kw):
+        x = features(volumes).reshape(-1, features(volumes).shape[-1])
+        y = np.asarray(greens, dtype=np.float64).reshape(-1)
+        w = np.linalg.solve(x.T @ x + ridge * np.eye(x.shape[1]), x.T @ y)
+        return cls(w, **kw)
+
+    def save(self, path):
+        pathlib.Path(path).write_text(json.dumps({"weights": self.w.tolist(), "meta": self.meta}, indent=1))
+
+    @classmethod
+    def load(cls, path, timing=DEFAULT_TIMING):
+        d = json.loads(pathlib.Path(path).read_text())
+        return cls(d["weights"], timing, d.get("meta"))
+
+
+@lru_cache(maxsize=None)
+def load_model(path=MODEL_PATH):
+    """The model at ``path``, read once per process; None if unavailable."""
+    try:
+        return GreenModel.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class LearnedPlanner:
+    """Batched model inference with a per-decision latency budget.
+
+    ``plan_many(volumes, queues)`` returns ``(greens, order)`` for N
+    junctions, or ``(None, None)`` in fallback, meaning the linear ramp and
+    highest-volume-next.  Fallback starts when the model is missing,
+    predicts non-finite greens, or exceeds ``budget_us`` per decision on
+    ``max_misses`` calls in a row.  Only calls of at least ``min_batch``
+    junctions count against the budget: below that the fixed cost of a
+    call (about 100 µs) dominates, and dividing it by N says nothing about
+    the model.  Smaller calls are still timed.  ``reason`` says why the
+    planner is in fallback; unless the model is missing, the next call after
+    ``retry_s`` runs the model again and leaves fallback if it is healthy.
+    """
+
+    def __init__(self, model=None, budget_us=50.0, max_misses=3, min_batch=64, retry_s=30.0,
+                 demand=DEFAULT_DEMAND):
+        self.model = model if model is not None else load_model()
+        self.budget_us = budget_us
+        self.max_misses = max_misses
+        self.min_batch = min_batch
+        self.retry_s = retry_s
+        self.demand = demand
+        self.misses = 0
+        self.fallback = self.model is None
+        self.reason = "no model" if self.fallback else None
+        self.calls = 0
+        self._retry_at = 0.0
+        self._lat = np.zeros(256)                       # recent µs per decision
+
+    def plan_many(self, volumes, queues=None):
+        if self.fallback and (self.model is None or time.monotonic() < self._retry_at):
+            return None, None
+        t0 = time.perf_counter()
+        v = np.atleast_2d(np.asarray(volumes, dtype=np.float64))
+        if queues is not None:
+            d = self.demand
+            rate = v / 10 * d.spawn_scale / d.spawn_every + np.asarray(queues) / QUEUE_HORIZON
+            v = rate_to_volume(rate, d)
+        greens, order = self.model.predict(v)
+        us = (time.perf_counter() - t0) * 1e6 / len(v)
+        self._lat[self.calls % self._lat.size] = us
+        self.calls += 1
+        if not np.isfinite(greens).all():
+            self._fall_back("non-finite")
+            return None, None
+        if len(v) >= self.min_batch:
+            self.misses = self.misses + 1 if us > self.budget_us else 0
+            if self.misses >= self.max_misses:
+                self._fall_back("over budget")
+                return greens, order
+        self.fallback, self.reason = False, None
+        return greens, order
+
+    def _fall_back(self, reason):
+        self.fallback, self.reason = True, reason
+        self._retry_at = time.monotonic() + self.retry_s
+
+    def __call__(self, volumes):
+        """Single-junction form of ``plan_many``, a drop-in ``planner`` for
+        ``des.JunctionDES`` and ``shared.SharedJunction``."""
+        if isinstance(volumes, dict):
+            volumes = [volumes[r] for r in ROADS]
+        greens, order = self.plan_many([volumes])
+        if greens is None:
+            return None, None, None
+        lost = len(ROADS) * (self.model.timing.yellow + self.model.timing.all_red)
+        return greens[0], order[0], float(greens[0].sum() + lost)
+
+    def latency(self):
+        """``{p50, p99, max}`` µs per decision over the recent calls."""
+        lat = self._lat[:min(self.calls, self._lat.size)]
+        if not lat.size:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        return {"p50": float(np.percentile(lat, 50)), "p99": float(np.percentile(lat, 99)),
+                "max": float(lat.max())}
+
+
+# ── Training ───────────────────────────────────────────────────────────────────
+def delay(res):
+    """Queued vehicle-seconds per served vehicle, including vehicles still
+    waiting at the end of the run."""
+    return float(res.queue_area.sum() / max(res.road.size, 1))
+
+
+def candidates(volumes, timing=DEFAULT_TIMING, demand=DEFAULT_DEMAND):
+    """Candidate greens (C, 3) around the Webster plan, and its order."""
+    greens, order, cycle = webster(volumes, timing, demand)
+    v = np.asarray(volumes, dtype=np.float64)
+    y = v / 10 * demand.spawn_scale / demand.spawn_every * demand.sat_headway
+    lost = len(ROADS) * (timing.yellow + timing.all_red)
+    out = []
+    for s, a in itertools.product(SCALES, TILTS):
+        share = y ** a / (y ** a).sum()
+        out.append(np.clip((cycle * s - lost) * share, timing.min_green, MAX_GREEN))
+    return np.round(out, 1), order
+
+
+def best_plan(volumes, duration=3600.0, seeds=(1, 2)):
+    """The candidate with the lowest mean ``delay`` over ``seeds``."""
+    cands, order = candidates(volumes)
+    cost = [np.mean([delay(JunctionDES(volumes, seed=s, planner=lambda _, g=g: (g, order)).run(duration))
+                     for s in seeds]) for g in cands]
+    i = int(np.argmin(cost))
+    return cands[i], cost[i]
+
+
+def train(grid=TRAIN_VOLUMES, duration=3600.0, seeds=(1, 2), log=None):
+    triples = list(itertools.product(grid, repeat=len(ROADS)))
+    x, y = [], []
+    for k, tri in enumerate(triples):
+        greens, _ = best_plan(tri, duration, seeds)
+        x.append(tri)
+        y.append(greens)
+        if log:
+            log(f"\r{k + 1}/{len(triples)} plans")
+    model = GreenModel.fit(np.array(x), np.array(y),
+                           meta={"grid": list(grid), "duration": duration, "seeds": list(seeds)})
+    if log:
+        log("\n")
+    return model
+
+
+def evaluate(model, triples, duration=3600.0, seeds=(11, 12)):
+    """Mean ``delay`` of the linear rule, Webster and the model on ``triples``."""
+    from .plans import PlanTable
+    table = PlanTable.build()
+    planner = LearnedPlanner(model, budget_us=float("inf"))
+    rows = {"linear": [], "webster": [], "learned": []}
+    for tri in triples:
+        for name, p in (("linear", None), ("webster", table.lookup), ("learned", planner)):
+            rows[name].append(np.mean([delay(JunctionDES(tri, seed=s, planner=p).run(duration))
+                                       for s in seeds]))
+    return {k: float(np.mean(v)) for k, v in rows.items()}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.learned",
+                                 description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("train", help="search plans in the simulator and fit the model")
+    p.add_argument("--out", default=str(MODEL_PATH))
+    p.add_argument("--grid", default=",".join(map(str, TRAIN_VOLUMES)), help="volumes per road")
+    p.add_argument("--duration", type=float, default=3600.0)
+    p = sub.add_parser("eval", help="compare delay against the linear rule and Webster")
+    p.add_argument("--model", default=str(MODEL_PATH))
+    p.add_argument("--triples", type=int, default=40, help="random held-out volume triples")
+    p.add_argument("--junctions", type=int, default=10_000, help="batch size for the latency test")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "train":
+        model = train(tuple(int(v) for v in args.grid.split(",")), args.duration,
+                      log=lambda s: print(s, end="", file=sys.stderr, flush=True))
+        model.save(args.out)
+        print(f"weights: {np.round(model.w, 3).tolist()} → {args.out}")
+        return
+
+    model = GreenModel.load(args.model)
+    rng = np.random.default_rng(0)
+    triples = [tuple(t) for t in rng.integers(1, 11, size=(args.triples, len(ROADS)))]
+    print(json.dumps({"delay_s": evaluate(model, triples)}, indent=1))
+    planner = LearnedPlanner(model)
+    vols = rng.uniform(1, 10, size=(args.junctions, len(ROADS)))
+    queues = rng.integers(0, 12, size=vols.shape)
+    for _ in range(50):
+        planner.plan_many(vols, queues)
+    print(json.dumps({"junctions": args.junctions, "us_per_decision": planner.latency(),
+                      "fallback": planner.fallback}, indent=1))
+
+
+if __name__ == "__main__":
+    main()
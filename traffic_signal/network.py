@@ -0,0 +1,421 @@
+"""
+Road Network
+============
+Many junctions joined by links, simulated in fixed time steps.
+
+Every junction is the page's three-way junction with its
+``SignalEngine`` state machine.  Traffic goes straight through, as on the
+page: the north approach carries southbound traffic, which leaves on the
+south side and, after the link's travel time, joins the north approach of
+the next junction down.  South carries northbound traffic and west carries
+eastbound traffic.  Vehicles enter at the edge of the network as Poisson
+arrivals at the page's spawn rate and leave at the far edge.
+
+Approaches are counts rather than individual vehicles.  A queue on green or
+yellow discharges one vehicle per saturation headway, the same as in
+``des.py``.  Each link is a delay line of counts, a ring with one row per
+step.  Every ``replan_s`` seconds the arrival rate measured on each approach
+becomes that approach's 1–10 volume, so the default highest-volume-first
+policy follows the real load; ``policy="learned"`` instead asks
+``learned.LearnedPlanner`` for every junction's greens and order in one
+batched call, from those volumes and the current queues.
+``green_wave()`` coordinates the signals
+instead.  Each junction gets a Webster plan stretched to a common cycle,
+and its start is offset so that a platoon released on green meets green
+at the next junction.
+
+``run(workers=k)`` splits the junctions into ``k`` contiguous regions of
+whole rows.  Each region runs in its own process.  Vehicles that cross a
+region boundary are exchanged every ``sync`` steps, where ``sync`` is the
+shortest travel time on any link.  Such a vehicle cannot arrive before the
+next exchange, so a partitioned run gives exactly the same result as a
+serial one.
+
+    net = Network.grid(64, 64, travel_s=20, volumes=(6, 6, 4))
+    net.green_wave("west")
+    net.run(3600, workers=8).summary()
+
+    python -m traffic_signal.network --rows 64 --cols 64 --minutes 60 --workers 8
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from .des import DEFAULT_DEMAND
+from .engine import DEFAULT_TIMING, GREEN, ROADS, TRANSITION, YELLOW, SignalEngine, road_index
+from .ingest import rate_to_volume
+from .learned import LearnedPlanner
+from .plans import webster
+
+K = len(ROADS)
+NORTH, SOUTH, WEST = (road_index(r) for r in ("north", "south", "west"))
+
+
+# ── Topology ───────────────────────────────────────────────────────────────────
+class Network:
+    """Junctions ``0..n-1`` and the links between their approaches.
+
+    Approach ``a = 3·junction + road``.  ``down[j, r]`` is the approach
+    that traffic leaving ``(j, r)`` joins (-1: it leaves the network),
+    ``travel[j, r]`` is the time to get there in seconds, and ``volumes[j, r]``
+    is the expected 1–10 volume.  ``source`` marks the approaches fed from
+    outside, which see arrivals at ``volumes``.
+    """
+
+    def __init__(self, down, travel, volumes, source, cols=None,
+                 timing=DEFAULT_TIMING, demand=DEFAULT_DEMAND):
+        self.down = np.asarray(down, dtype=np.int64)
+        self.n = self.down.shape[0]
+        self.travel = np.broadcast_to(np.asarray(travel, dtype=np.float64), self.down.shape).copy()
+        self.volumes = np.broadcast_to(np.asarray(volumes, dtype=np.float64), self.down.shape).copy()
+        self.source = np.asarray(source, dtype=bool)
+        self.cols = cols or self.n
+        self.timing, self.demand = timing, demand
+        # Coordination (green_wave): per-junction plan and offset, or None.
+        self.plan_green = self.plan_order = self.offset = None
+        self.cycle = None
+
+    @classmethod
+    def grid(cls, rows, cols, travel_s=20.0, volumes=(5, 5, 5), **kw):
+        """``rows × cols`` junctions, numbered row by row.
+
+        ``volumes`` is the (north, south, west) volume entering at the top,
+        bottom and left edges; through traffic keeps that volume.
+        """
+        j = np.arange(rows * cols).reshape(rows, cols)
+        down = np.full((rows, cols, K), -1, dtype=np.int64)
+        down[:-1, :, NORTH] = 3 * j[1:] + NORTH            # southbound → row below
+        down[1:, :, SOUTH] = 3 * j[:-1] + SOUTH            # northbound → row above
+        down[:, :-1, WEST] = 3 * j[:, 1:] + WEST           # eastbound → next column
+        source = np.zeros((rows, cols, K), dtype=bool)
+        source[0, :, NORTH] = source[-1, :, SOUTH] = source[:, 0, WEST] = True
+        return cls(down.reshape(-1, K), travel_s, np.broadcast_to(volumes, (rows, cols, K)).reshape(-1, K),
+                   source.reshape(-1, K), cols, **kw)
+
+    @classmethod
+    def corridor(cls, n, **kw):
+        """``n`` junctions in a row along the eastbound (west approach) road."""
+        return cls.grid(1, n, **kw)
+
+    # ── Coordination ──────────────────────────────
+    def green_wave(self, road="west", cycle=None):
+        """Coordinate every junction for traffic on ``road``.
+
+        Each junction gets its Webster plan (busiest road first), with the
+        greens stretched so that every cycle lasts ``cycle`` seconds, by
+        default the longest Webster cycle in the network.  The offset of
+        ``road``'s green start is the summed travel time along the line, so
+        it moves with the traffic.
+        """
+        r = road_index(road)
+        greens, order, cyc = webster(self.volumes, self.timing, self.demand)
+        cycle = float(cyc.max() if cycle is None else cycle)
+        lost = K * (self.timing.yellow + self.timing.all_red)
+        greens = greens * ((cycle - lost) / greens.sum(axis=1))[:, None]
+        offset = np.zeros(self.n)
+        up = np.full(self.n, -1, dtype=np.int64)           # upstream junction on the line
+        has = self.down[:, r] >= 0
+        up[self.down[has, r] // K] = np.flatnonzero(has)
+        for j in self._line_order(up):
+            if up[j] >= 0:
+                offset[j] = offset[up[j]] + self.travel[up[j], r]
+        self.plan_green, self.plan_order = greens, order
+        self.offset, self.cycle, self.wave_road = offset % cycle, cycle, r
+        return self
+
+    def uncoordinate(self):
+        self.plan_green = self.plan_order = self.offset = self.cycle = None
+        return self
+
+    @staticmethod
+    def _line_order(up):
+        """Junctions ordered so that each comes after its upstream one."""
+        depth = np.zeros(up.size, dtype=np.int64)
+        for j in range(up.size):                           # lines are short chains
+            k = j
+            while up[k] >= 0:
+                depth[j] += 1
+                k = up[k]
+        return np.argsort(depth, kind="stable")
+
+    # ── Partitioning ──────────────────────────────
+    def partition(self, k):
+        """``k`` contiguous ``(first, end)`` junction ranges, split between
+        rows where there are enough rows."""
+        rows = self.n // self.cols
+        unit = self.cols if rows >= k else 1
+        cuts = np.linspace(0, self.n // unit, k + 1).round().astype(int) * unit
+        return [(a, b) for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
+
+    def steps(self, step):
+        """Link travel in whole steps (at least one), and the exchange
+        interval: the shortest link."""
+        travel = np.maximum(1, np.rint(self.travel / step)).astype(np.int64)
+        linked = self.down >= 0
+        sync = int(travel[linked].min()) if linked.any() else 1
+        return travel, sync
+
+    # ── Running ───────────────────────────────────
+    def run(self, duration, workers=1, step=1.0, seed=0, replan_s=30.0, policy="adaptive"):
+        """Simulate ``duration`` seconds and return a ``NetworkResult``.
+
+        ``policy`` is ``"adaptive"`` (ramp, highest volume next) or
+        ``"learned"``; it is ignored while a green wave is set.
+        """
+        if policy not in ("adaptive", "learned"):
+            raise ValueError(f"unknown policy {policy!r}")
+        regions = self.partition(max(1, int(workers)))
+        travel, sync = self.steps(step)
+        n_steps = int(round(duration / step))
+        epochs = -(-n_steps // sync)
+        args = (self, step, seed, replan_s, policy)
+        t0 = time.perf_counter()
+        if len(regions) == 1:
+            reg = Region(*regions[0], *args)
+            for e in range(epochs):
+                reg.run(e, min((e + 1) * sync, n_steps))
+            parts = [reg.result()]
+        else:
+            parts = _run_parallel(regions, args, epochs, sync, n_steps)
+        wall = time.perf_counter() - t0
+        return NetworkResult(n_steps * step, wall, len(regions), parts)
+
+
+# ── Region ─────────────────────────────────────────────────────────────────────
+class Region:
+    """Junctions ``[g0, g1)`` of a network: their signals, queues and
+    the links that end in them."""
+
+    def __init__(self, g0, g1, net, step, seed, replan_s, policy="adaptive"):
+        self.g0, self.g1, self.step, self.seed = g0, g1, float(step), seed
+        n = g1 - g0
+        a0, a1 = K * g0, K * g1
+        travel, self.sync = net.steps(step)
+        self.travel = travel[g0:g1].ravel()
+        self.H = int(travel.max()) + 1                      # ring rows cover the longest link
+        down = net.down[g0:g1].ravel()
+        local = (down >= a0) & (down < a1)
+        self.down_local = np.where(local, down - a0, -1)
+        self.down_remote = np.where(~local & (down >= 0), down, -1)
+        self.exits = down < 0
+        self.a0 = a0
+
+        d = self.demand = net.demand
+        sources = np.flatnonzero(net.source.ravel())
+        self.src_lo, self.src_hi = np.searchsorted(sources, [a0, a1])
+        self.src_rate = net.volumes.ravel()[sources] / 10 * d.spawn_scale / d.spawn_every
+        self.src_local = sources[self.src_lo:self.src_hi] - a0
+
+        vol = net.volumes[g0:g1]
+        self.engine = SignalEngine(n, net.timing, vol)
+        self.coordinated = net.plan_green is not None
+        if self.coordinated:
+            eng = self.engine
+            order = net.plan_order[g0:g1]
+            eng.set_plan(slice(None), net.plan_green[g0:g1], order)
+            # Start in the all-red before the wave road's green, which then
+            # begins at the junction's offset.
+            pos = (order == net.wave_road).argmax(axis=1)
+            eng.green[:] = order[np.arange(n), pos - 1]
+            eng.phase[:] = TRANSITION
+            eng.remaining[:] = net.timing.start_delay + net.offset[g0:g1]
+
+        self.headway = d.sat_headway
+        self.replan = max(1, int(round(replan_s / step)))
+        self.planner = LearnedPlanner() if policy == "learned" and not self.coordinated else None
+        self.alpha = min(1.0, step / 60.0)                  # ~1 min rate smoothing
+        self.rate = (vol / 10 * d.spawn_scale / d.spawn_every).ravel()
+        self.queue = np.zeros(K * n, dtype=np.int64)
+        self.credit = np.zeros(K * n)
+        self.ring = np.zeros((self.H, K * n), dtype=np.int64)
+        self.arrived = np.zeros(K * n, dtype=np.int64)
+        self.served = np.zeros(K * n, dtype=np.int64)
+        self.area = np.zeros(K * n)                         # queued vehicle-seconds
+        self.entered = self.exited = 0
+        self.outbox = []
+        self.s = 0
+
+    def deliver(self, dest, at, count):
+        """Vehicles from another region: ``count`` join global approach
+        ``dest`` at step ``at``."""
+        np.add.at(self.ring, (at % self.H, dest - self.a0), count)
+
+    def run(self, epoch, end):
+        """Advance to step ``end``; returns the vehicles sent to other regions
+        as ``(dest, at, count)`` arrays."""
+        steps = end - self.s
+        rng = np.random.Generator(np.random.Philox(key=self.seed, counter=epoch))
+        spawns = rng.poisson(self.src_rate * self.step, size=(self.sync, self.src_rate.size))
+        spawns = spawns[:steps, self.src_lo:self.src_hi]
+        lanes = np.arange(K)
+        eng, dt = self.engine, self.step
+        for k in range(steps):
+            s = self.s
+            slot = s % self.H
+            arr = self.ring[slot].copy()
+            self.ring[slot] = 0
+            arr[self.src_local] += spawns[k]
+            self.entered += int(spawns[k].sum())
+            self.queue += arr
+            self.arrived += arr
+            self.rate += self.alpha * (arr / dt - self.rate)
+
+            go = ((eng.phase == GREEN) | (eng.phase == YELLOW))[:, None] & (eng.green[:, None] == lanes)
+            cap = np.where(go.ravel(), self.credit + dt / self.headway, 0.0)
+            out = np.minimum(self.queue, cap.astype(np.int64))
+            self.credit = np.minimum(cap - out, 1.0)        # carry at most one partial vehicle
+            self.queue -= out
+            self.served += out
+            self.area += self.queue * dt
+
+            moved = np.flatnonzero(out)
+            if moved.size:
+                self._route(moved, out[moved], s)
+            eng.advance(dt)
+            self.s = s + 1
+            if not self.coordinated and self.s % self.replan == 0:
+                eng.set_volumes(slice(None), rate_to_volume(self.rate, self.demand).reshape(-1, K))
+                if self.planner is not None:
+                    greens, order = self.planner.plan_many(eng.volumes, self.queue.reshape(-1, K))
+                    eng.set_plan(slice(None), greens, order)
+        box, self.outbox = self.outbox, []
+        if not box:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+        return tuple(np.concatenate(c) for c in zip(*box))
+
+    def _route(self, moved, count, s):
+        at = s + self.travel[moved]
+        dst = self.down_local[moved]
+        m = dst >= 0
+        np.add.at(self.ring, (at[m] % self.H, dst[m]), count[m])
+        rem = self.down_remote[moved]
+        r = rem >= 0
+        if r.any():
+            self.outbox.append((rem[r], at[r], count[r]))
+        self.exited += int(count[self.exits[moved]].sum())
+
+    def result(self):
+        n = self.g1 - self.g0
+        return {
+            "first": self.g0,
+            "arrived": self.arrived.reshape(n, K), "served": self.served.reshape(n, K),
+            "area": self.area.reshape(n, K), "queue": self.queue.reshape(n, K),
+            "in_transit": int(self.ring.sum()), "entered": self.entered, "exited": self.exited,
+            "cycles": self.engine.cycles.copy(),
+        }
+
+
+# ── Parallel execution ─────────────────────────────────────────────────────────
+def _worker(conn, g0, g1, args):
+    reg = Region(g0, g1, *args)
+    while True:
+        msg = conn.recv()
+        if msg[0] == "run":
+            _, epoch, end, inbox = msg
+            if inbox[0].size:
+                reg.deliver(*inbox)
+            conn.send(reg.run(epoch, end))
+        elif msg[0] == "result":
+            conn.send(reg.result())
+        else:
+            conn.close()
+            return
+
+
+def _run_parallel(regions, args, epochs, sync, n_steps):
+    """One process per region; boundary flows are exchanged after every
+    ``sync`` steps."""
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    starts = np.array([K * g0 for g0, _ in regions])
+    conns, procs = [], []
+    for g0, g1 in regions:
+        parent, child = ctx.Pipe()
+        p = ctx.Process(target=_worker, args=(child, g0, g1, args), daemon=True)
+        p.start()
+        conns.append(parent)
+        procs.append(p)
+    empty = (np.empty(0, np.int64),) * 3
+    inboxes = [empty] * len(regions)
+    try:
+        for e in range(epochs):
+            end = min((e + 1) * sync, n_steps)
+            for c, inbox in zip(conns, inboxes):
+                c.send(("run", e, end, inbox))
+            sent = [c.recv() for c in conns]
+            dest, at, count = (np.concatenate(c) for c in zip(*sent))
+            owner = np.searchsorted(starts, dest, side="right") - 1
+            inboxes = [(dest[owner == i], at[owner == i], count[owner == i])
+                       for i in range(len(regions))]
+        in_flight = sum(int(b[2].sum()) for b in inboxes)
+        for c in conns:
+            c.send(("result",))
+        parts = [c.recv() for c in conns]
+        parts[0]["in_transit"] += in_flight
+    finally:
+        for c in conns:
+            try:
+                c.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        for p in procs:
+            p.join(timeout=5)
+    return parts
+
+
+# ── Result ─────────────────────────────────────────────────────────────────────
+class NetworkResult:
+    """Per-approach totals of a network run (arrays are (junctions, 3))."""
+
+    def __init__(self, duration, wall, regions, parts):
+        self.duration, self.wall, self.regions = duration, wall, regions
+        parts = sorted(parts, key=lambda p: p["first"])
+        for key in ("arrived", "served", "area", "queue", "cycles"):
+            setattr(self, key, np.concatenate([p[key] for p in parts]))
+        self.entered = sum(p["entered"] for p in parts)
+        self.exited = sum(p["exited"] for p in parts)
+        self.in_transit = sum(p["in_transit"] for p in parts)
+
+    def summary(self):
+        served = self.served.sum()
+        return {
+            "junctions": int(self.served.shape[0]),
+            "regions": self.regions,
+            "entered": int(self.entered),
+            "exited": int(self.exited),
+            "queued": int(self.queue.sum()),
+            "in_transit": int(self.in_transit),
+            "mean_delay": float(self.area.sum() / max(served, 1)),
+            "delay_by_road": {r: float(self.area[:, i].sum() / max(self.served[:, i].sum(), 1))
+                              for i, r in enumerate(ROADS)},
+            "speedup": float(self.duration / max(self.wall, 1e-9)),
+        }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.network",
+                                 description=__doc__.split("\n\n")[0])
+    ap.add_argument("--rows", type=int, default=16)
+    ap.add_argument("--cols", type=int, default=16)
+    ap.add_argument("--travel", type=float, default=20.0, help="link travel time, s")
+    ap.add_argument("--volumes", default="5,5,5", help="north,south,west volumes at the edges")
+    ap.add_argument("--minutes", type=float, default=60.0)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--step", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--wave", choices=ROADS, help="coordinate a green wave for this road")
+    ap.add_argument("--policy", choices=("adaptive", "learned"), default="adaptive")
+    args = ap.parse_args(argv)
+    net = Network.grid(args.rows, args.cols, args.travel,
+                       [float(v) for v in args.volumes.split(",")])
+    if args.wave:
+        net.green_wave(args.wave)
+    res = net.run(args.minutes * 60, args.workers, args.step, args.seed, policy=args.policy)
+    print(json.dumps(res.summary(), indent=1))
+
+
+if __name__ == "__main__":
+    main()
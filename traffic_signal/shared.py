@@ -0,0 +1,218 @@
+"""
+Shared Junction
+===============
+One real-time signal engine per junction, shared by every operator session.
+
+A background thread advances a one-junction ``SignalEngine`` in wall-clock
+time and applies control commands from a single queue, so changes from any
+number of sessions are serialised.  After each step it publishes an immutable
+snapshot; sessions only read that snapshot, which makes fan-out a dict lookup
+per session rather than a simulation per session.
+
+Snapshots carry a ``version`` that changes only on discrete events (phase
+change, command), so subscribers can skip unchanged state cheaply.  An
+optional ``TelemetryStore`` is sampled from the same thread.  Step, command
+and plan-decision latencies go to ``metrics.REGISTRY``.
+"""
+
+import queue
+import threading
+import time
+
+from .engine import DEFAULT_TIMING, NO_ROAD, PHASES, ROADS, SignalEngine
+from .latency import now_ms
+from .metrics import REGISTRY
+
+SESSION_TTL = 10.0               # s since last poll before a session stops counting
+
+
+class Command:
+    """One queued control change; ``wait()`` blocks until the engine applied it."""
+
+    __slots__ = ("kind", "args", "done", "applied_at", "error", "created")
+
+    def __init__(self, kind, args):
+        self.kind, self.args = kind, args
+        self.created = time.perf_counter()
+        self.done = threading.Event()
+        self.applied_at = None
+        self.error = None
+
+    def wait(self, timeout=1.0):
+        return self.done.wait(timeout)
+
+
+class SharedJunction:
+    """Real-time engine for one junction with a serialised command queue.
+
+    ``planners`` maps a plan-mode name to ``planner(volumes) -> (greens,
+    order, ...)``; mode ``None`` is the built-in linear ramp.  A planner that
+    returns no greens is in fallback: the junction runs the linear ramp,
+    says so in the snapshot's ``planFallback``, and asks the planner again
+    every cycle.
+    """
+
+    def __init__(self, junction_id, timing=DEFAULT_TIMING, planners=None,
+                 volumes=(5, 5, 5), tick=0.05, preemption_log=None, telemetry=None):
+        self.junction_id = junction_id
+        self.tick = tick
+        self.planners = planners or {}
+        self.preemption_log = preemption_log
+        self.telemetry = telemetry       # telemetry.TelemetryStore, sampled by the engine thread
+        self.engine = SignalEngine(1, timing, volumes=volumes)
+        self.plan_mode = None
+        self.plan_fallback = None        # why the chosen planner gave no plan, if it did not
+        self._plan_cycle = 0
+        self._commands = queue.Queue()
+        self._dispatch = None            # stamp dict of the dispatch being served
+        self._sessions = {}
+        self._snapshot = None
+        self._key = None
+        self._version = 0
+        self._stop = threading.Event()
+        REGISTRY.gauge_fn("engine_command_queue_depth", self.queue_depth, junction=junction_id)
+        REGISTRY.gauge_fn("app_sessions", self.session_count, junction=junction_id)
+        self._publish(now_ms())
+        self._thread = threading.Thread(target=self._run, name=f"junction-{junction_id}", daemon=True)
+        self._thread.start()
+
+    # ── Session side ──────────────────────────────
+    def submit(self, kind, *args, wait=True, timeout=1.0):
+        """Queue a command: ``("volumes", {...})``, ``("dispatch", road, stamp)``,
+        ``("clear",)`` or ``("plan_mode", mode)``."""
+        cmd = Command(kind, args)
+        self._commands.put(cmd)
+        if wait:
+            cmd.wait(timeout)
+        return cmd
+
+    def snapshot(self, session_id=None):
+        """Latest published state (shared, do not mutate)."""
+        if session_id is not None:
+            self._sessions[session_id] = time.monotonic()
+        return self._snapshot
+
+    def session_count(self):
+        cutoff = time.monotonic() - SESSION_TTL
+        for sid, seen in list(self._sessions.items()):
+            if seen < cutoff:
+                self._sessions.pop(sid, None)
+        return len(self._sessions)
+
+    def queue_depth(self):
+        return self._commands.qsize()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    # ── Engine thread ─────────────────────────────
+    def _run(self):
+        last = time.monotonic()
+        while not self._stop.is_set():
+            wait = min(self.tick, max(self.engine.next_event_in(), 0.0))
+            try:
+                cmd = self._commands.get(timeout=wait)
+            except queue.Empty:
+                cmd = None
+            now = time.monotonic()
+            t0 = time.perf_counter()
+            self.engine.advance(now - last)
+            REGISTRY.observe("engine_step_seconds", time.perf_counter() - t0, junction=self.junction_id)
+            last = now
+            while cmd is not None:
+                self._apply(cmd)
+                try:
+                    cmd = self._commands.get_nowait()
+                except queue.Empty:
+                    cmd = None
+            if self.plan_fallback and int(self.engine.cycles[0]) != self._plan_cycle:
+                self._replan()
+            # Drained every step: the engine keeps latencies until asked.
+            for lat in self.engine.preemption_latencies():
+                REGISTRY.observe("engine_preemption_seconds", lat, junction=self.junction_id)
+            self._publish(now_ms())
+            if self.telemetry is not None:
+                self.telemetry.sample(self.engine, 0, time.time())
+
+    def _apply(self, cmd):
+        try:
+            self._execute(cmd)
+        except Exception as exc:          # a bad command must not stop the junction
+            cmd.error = exc
+        cmd.applied_at = now_ms()
+        cmd.done.set()
+        REGISTRY.observe("engine_command_seconds", time.perf_counter() - cmd.created, kind=cmd.kind)
+
+    def _execute(self, cmd):
+        eng = self.engine
+        if cmd.kind == "volumes":
+            eng.set_volumes(0, cmd.args[0])
+            self._replan()
+        elif cmd.kind == "plan_mode":
+            self.plan_mode = cmd.args[0]
+            self._replan()
+        elif cmd.kind == "dispatch":
+            road, stamp = cmd.args
+            eng.dispatch(0, road)
+            self._dispatch = stamp
+            if stamp and self.preemption_log is not None:
+                self.preemption_log.report({"id": stamp["id"], "ackAt": now_ms()})
+        elif cmd.kind == "clear":
+            eng.clear_emergency(0)
+            self._dispatch = None
+        else:
+            raise ValueError(f"unknown command {cmd.kind!r}")
+
+    def _replan(self):
+        planner = self.planners.get(self.plan_mode)
+        self._plan_cycle = int(self.engine.cycles[0])
+        self.plan_fallback = None
+        if planner is None:
+            self.engine.set_plan(0)
+        else:
+            with REGISTRY.timer("plan_decision_seconds", mode=self.plan_mode):
+                greens, order = planner(self.engine.volumes[0])[:2]
+            if greens is None:
+                self.plan_fallback = getattr(planner, "reason", None) or "no plan"
+            self.engine.set_plan(0, greens, order)
+
+    def _publish(self, at):
+        eng = self.engine
+        g, e = int(eng.green[0]), int(eng.emergency[0])
+        greens = eng.green_times(0)
+        order = [ROADS[i] for i in eng.plan_order[0]] if eng.plan_order[0, 0] != NO_ROAD else None
+        key = (g, int(eng.phase[0]), int(eng.cycles[0]), e, bool(eng.emg_handled[0]),
+               tuple(eng.volumes[0]), self.plan_mode, self.plan_fallback, tuple(greens),
+               self._dispatch and self._dispatch["id"])
+        if key == self._key:
+            return
+        self._key = key
+        self._version += 1
+        REGISTRY.inc("engine_transitions_total", junction=self.junction_id)
+        self._snapshot = {
+            "type": "signal",
+            "junction": self.junction_id,
+            "version": self._version,
+            "at": at,
+            "green": ROADS[g] if g != NO_ROAD else None,
+            "phase": PHASES[eng.phase[0]],
+            "remaining": float(eng.remaining[0]),
+            "cycles": int(eng.cycles[0]),
+            "emergency": ROADS[e] if e != NO_ROAD else None,
+            "emgHandled": bool(eng.emg_handled[0]),
+            "volumes": {r: float(v) for r, v in zip(ROADS, eng.volumes[0])},
+            "greens": {r: float(s) for r, s in zip(ROADS, greens)},
+            "order": order,
+            "planMode": self.plan_mode,
+            "planFallback": self.plan_fallback,
+            # Page format: green ms per road and a fixed cycle, or null → ramp.
+            "plan": {"greens": {r: round(s * 1000) for r, s in zip(ROADS, greens)}, "order": order}
+                    if order else None,
+            "dispatch": self._dispatch,
+        }
+
+
+def junction_volumes(snapshot):
+    """Snapshot volumes as ``{road: int}`` for the 1–10 sliders."""
+    return {r: int(round(v)) for r, v in snapshot["volumes"].items()}
@@ -0,0 +1,230 @@
+"""
+Scenario Sweep
+==============
+Grid search over controller timing × volume profiles, run on every core.
+
+    python -m traffic_signal.sweep --out runs/study1 \\
+        --min-green 4 5 6 --max-green 15 18 21 --yellow 2.5 3 \\
+        --all-red 0.3 1.0 --emergency-factor 0.6 \\
+        --volumes all --curves commuter weekend
+
+Each cell (one timing × one profile) is simulated with ``des.JunctionDES``:
+an hour for a fixed volume triple, a day for a time-of-day curve.
+Finished cells are appended to ``OUT/part-*.npz`` column shards as they come
+back from the pool.  Re-running the same command resumes: cells already in a
+shard are skipped.  ``load_results(OUT)`` concatenates the shards.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pathlib
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from .des import JunctionDES
+from .engine import DEFAULT_TIMING, ROADS, TimingParams
+
+TIMING_FIELDS = ("min_green", "max_green", "yellow", "all_red", "emergency_factor")
+
+# ── Time-of-day curves: 24 hourly (north, south, west) volumes ─────────────────
+CURVES = {
+    "commuter": [
+        (1, 1, 1), (1, 1, 1), (1, 1, 1), (1, 1, 1), (2, 1, 1), (3, 2, 1),
+        (6, 3, 2), (10, 4, 3), (9, 4, 3), (6, 4, 3), (5, 5, 3), (5, 5, 4),
+        (5, 5, 4), (5, 5, 4), (4, 5, 3), (4, 6, 3), (4, 8, 4), (4, 10, 5),
+        (3, 9, 4), (3, 6, 3), (2, 4, 2), (2, 3, 2), (1, 2, 1), (1, 1, 1),
+    ],
+    "weekend": [
+        (2, 2, 2), (1, 1, 1), (1, 1, 1), (1, 1, 1), (1, 1, 1), (1, 1, 1),
+        (1, 1, 1), (2, 2, 1), (3, 3, 2), (4, 4, 3), (5, 5, 5), (6, 6, 6),
+        (6, 6, 7), (6, 6, 7), (6, 6, 6), (6, 6, 6), (5, 5, 5), (5, 5, 5),
+        (5, 5, 4), (5, 5, 4), (4, 4, 5), (4, 4, 6), (3, 3, 4), (2, 2, 3),
+    ],
+}
+
+COLUMNS = {
+    "cell": np.int64, "profile": np.int32,
+    "min_green": np.float32, "max_green": np.float32, "yellow": np.float32,
+    "all_red": np.float32, "emergency_factor": np.float32,
+    "mean_delay": np.float32, "p95_delay": np.float32,
+    "mean_queue": np.float32, "max_queue": np.int32,
+    "crossed": np.int64, "spawned": np.int64, "cycles": np.int64,
+}
+
+
+# ── Grid ───────────────────────────────────────────────────────────────────────
+def build_profiles(volumes, curves, curve_file=None):
+    """Profiles as ``(name, hourly)``; a fixed triple is a 1-hour schedule."""
+    profiles = []
+    if volumes == "all":
+        triples = itertools.product(range(1, 11), repeat=len(ROADS))
+    else:
+        triples = [tuple(int(v) for v in s.split(",")) for s in volumes]
+    for tri in triples:
+        profiles.append(("{}-{}-{}".format(*tri), [tri]))
+    extra = dict(CURVES)
+    if curve_file:
+        extra.update(json.loads(pathlib.Path(curve_file).read_text()))
+    for name in curves:
+        if name not in extra:
+            sys.exit(f"unknown curve {name!r}; known: {', '.join(sorted(extra))}")
+        profiles.append((name, [tuple(h) for h in extra[name]]))
+    return profiles
+
+
+def build_grid(args):
+    return list(itertools.product(*(getattr(args, f) for f in TIMING_FIELDS)))
+
+
+def grid_digest(spec):
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+# ── Worker ─────────────────────────────────────────────────────────────────────
+def run_cell(cell, timing, schedule, duration, seed):
+    """Simulate one cell.  A multi-hour schedule switches volumes hourly and
+    repeats until ``duration``."""
+    des = JunctionDES(schedule[0], TimingParams(**timing), seed=seed + cell)
+    if len(schedule) > 1:
+        for h in range(1, int(np.ceil(duration / 3600))):
+            des.at(h * 3600, "volumes", schedule[h % len(schedule)])
+    res = des.run(duration)
+    s = res.summary()
+    return {
+        "mean_delay": s["mean_delay"],
+        "p95_delay": float(np.percentile(res.delay, 95)) if res.delay.size else 0.0,
+        "mean_queue": float(res.queue_area.sum() / duration),
+        "max_queue": int(res.queue_max.max()),
+        "crossed": int(res.delay.size),
+        "spawned": int(res.spawned.sum()),
+        "cycles": res.cycles,
+    }
+
+
+def run_chunk(cells, grid, profiles, durations, seed):
+    """``durations`` is ``(fixed-volume seconds, curve seconds)``."""
+    rows = []
+    n_prof = len(profiles)
+    for cell in cells:
+        g, p = divmod(cell, n_prof)
+        timing = dict(zip(TIMING_FIELDS, grid[g]))
+        schedule = profiles[p][1]
+        duration = durations[len(schedule) > 1]
+        row = run_cell(cell, timing, schedule, duration, seed)
+        row.update(timing, cell=cell, profile=p)
+        rows.append(row)
+    return rows
+
+
+# ── Storage ────────────────────────────────────────────────────────────────────
+def write_shard(out, rows):
+    """Write one column shard atomically (tmp file + rename)."""
+    n = len(list(out.glob("part-*.npz")))
+    cols = {k: np.array([r[k] for r in rows], dtype=t) for k, t in COLUMNS.items()}
+    tmp = out / f".part-{n:06d}.tmp.npz"
+    np.savez(tmp, **cols)
+    os.replace(tmp, out / f"part-{n:06d}.npz")
+
+
+def load_results(out):
+    """All finished cells as ``{column: array}``; profile names under ``"profiles"``."""
+    out = pathlib.Path(out)
+    parts = sorted(out.glob("part-*.npz"))
+    cols = {k: [] for k in COLUMNS}
+    for p in parts:
+        with np.load(p) as z:
+            for k in COLUMNS:
+                cols[k].append(z[k])
+    res = {k: np.concatenate(v) if v else np.empty(0, dtype=COLUMNS[k]) for k, v in cols.items()}
+    manifest = json.loads((out / "sweep.json").read_text())
+    res["profiles"] = np.array([p[0] for p in manifest["profiles"]])
+    return res
+
+
+def done_cells(out):
+    done = set()
+    for p in out.glob("part-*.npz"):
+        with np.load(p) as z:
+            done.update(z["cell"].tolist())
+    return done
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+def parse_args(argv=None):
+    d = DEFAULT_TIMING
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.sweep", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--out", required=True, help="output directory (created; resumed if it exists)")
+    ap.add_argument("--min-green", type=float, nargs="+", default=[d.min_green])
+    ap.add_argument("--max-green", type=float, nargs="+", default=[d.max_green])
+    ap.add_argument("--yellow", type=float, nargs="+", default=[d.yellow])
+    ap.add_argument("--all-red", type=float, nargs="+", default=[d.all_red])
+    ap.add_argument("--emergency-factor", type=float, nargs="+", default=[d.emergency_factor])
+    ap.add_argument("--volumes", nargs="*", default=["all"],
+                    help="'all' for every 1–10 triple, or N,S,W triples like 8,6,3")
+    ap.add_argument("--curves", nargs="*", default=[], help=f"time-of-day curves ({', '.join(CURVES)})")
+    ap.add_argument("--curve-file", help="JSON {name: [[n, s, w] × 24]} of extra curves")
+    ap.add_argument("--duration", type=float, default=3600.0, help="simulated seconds per fixed-volume cell")
+    ap.add_argument("--curve-duration", type=float, default=86400.0, help="simulated seconds per curve cell")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--chunk", type=int, default=32, help="cells per task and per shard")
+    args = ap.parse_args(argv)
+    if args.volumes == ["all"]:
+        args.volumes = "all"
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    out = pathlib.Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+
+    grid = build_grid(args)
+    profiles = build_profiles(args.volumes, args.curves, args.curve_file)
+    spec = {"grid": grid, "fields": TIMING_FIELDS, "profiles": profiles,
+            "durations": (args.duration, args.curve_duration), "seed": args.seed}
+    digest = grid_digest(spec)
+    manifest = out / "sweep.json"
+    if manifest.exists():
+        if json.loads(manifest.read_text())["digest"] != digest:
+            sys.exit(f"{out} holds a different sweep; use a new --out")
+    else:
+        manifest.write_text(json.dumps({"digest": digest, **spec}))
+
+    total = len(grid) * len(profiles)
+    done = done_cells(out)
+    todo = [c for c in range(total) if c not in done]
+    print(f"{total} cells, {len(done)} done, {len(todo)} to run on {args.workers} workers")
+    if not todo:
+        return
+
+    chunks = [todo[i:i + args.chunk] for i in range(0, len(todo), args.chunk)]
+    task = (grid, profiles, spec["durations"], args.seed)
+    t0, finished = time.perf_counter(), 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        pending = set()
+        it = iter(chunks)
+        for chunk in itertools.islice(it, 2 * args.workers):   # bounded in-flight work
+            pending.add(pool.submit(run_chunk, chunk, *task))
+        while pending:
+            ready, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in ready:
+                rows = fut.result()
+                write_shard(out, rows)
+                finished += len(rows)
+                nxt = next(it, None)
+                if nxt is not None:
+                    pending.add(pool.submit(run_chunk, nxt, *task))
+            rate = finished / (time.perf_counter() - t0)
+            print(f"\r{finished}/{len(todo)} cells · {rate:.1f}/s", end="", flush=True)
+    print()
+
+
+if __name__ == "__main__":
+    main()
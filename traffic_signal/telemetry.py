@@ -0,0 +1,207 @@
+"""
+Telemetry
+=========
+Bounded, array-backed history of one junction's signal telemetry.
+
+The shared engine is sampled every 150 ms (the page's ``updateHUD`` rate)
+into a preallocated ring of fixed-width columns.  Older history survives in
+coarser rollup rings that keep min / max / sum per bucket, so a month of
+data per junction fits in a few tens of MB and peaks are never averaged
+away.  ``series()`` answers a chart query from the finest ring that still
+covers the window, downsampled to a fixed number of points with
+``np.minimum.reduceat`` / ``np.maximum.reduceat``.
+
+Queue length and throughput come from a fluid model driven by the recorded
+signal state: arrivals at the page's spawn rate, departures at one vehicle
+per saturation headway while the road is green.
+"""
+
+import threading
+
+import numpy as np
+
+from .des import DEFAULT_DEMAND
+from .engine import GREEN, NO_ROAD, ROADS
+
+SAMPLE_S = 0.15
+K = len(ROADS)
+
+# Per-sample numeric fields: name → width.  Rollups keep min/max/sum of each.
+FIELDS = {
+    "queue": K,          # vehicles waiting per road (fluid model)
+    "served": K,         # cumulative departures per road
+    "volume": K,         # volume setting, 1–10
+    "green_s": K,        # seconds of green per road during the sample
+    "emergency": 1,      # 1 while an emergency is active
+}
+# (bucket seconds, rows): 6 h of raw samples, 3 days at 5 s, 35 days at 1 min.
+TIERS = ((5.0, 3 * 17_280), (60.0, 35 * 1_440))
+RAW_ROWS = 6 * 3600 * 1000 // int(SAMPLE_S * 1000)
+
+
+# ── Rings ──────────────────────────────────────────────────────────────────────
+class Ring:
+    """Fixed-capacity columns with a shared write head; rows stay time-sorted."""
+
+    def __init__(self, capacity, columns):
+        self.capacity = int(capacity)
+        self.cols = {name: np.zeros((self.capacity,) + tuple(shape), dtype)
+                     for name, (dtype, shape) in columns.items()}
+        self.head = 0                                  # next row to write
+        self.size = 0
+
+    def append(self, row):
+        i = self.head
+        for name, v in row.items():
+            self.cols[name][i] = v
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def span(self, t0, t1):
+        """Index array of the rows with ``t0 <= t < t1``, oldest first."""
+        start = (self.head - self.size) % self.capacity
+        t = self.cols["t"]
+        if start + self.size <= self.capacity:         # one contiguous segment
+            segs = [(start, start + self.size)]
+        else:
+            segs = [(start, self.capacity), (0, self.head)]
+        parts = []
+        for a, b in segs:
+            lo = a + np.searchsorted(t[a:b], t0, side="left")
+            hi = a + np.searchsorted(t[a:b], t1, side="left")
+            parts.append(np.arange(lo, hi))
+        return np.concatenate(parts)
+
+    def oldest(self):
+        return self.cols["t"][(self.head - self.size) % self.capacity] if self.size else np.inf
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.cols.values())
+
+
+def _columns(stats):
+    cols = {"t": (np.float64, ())}
+    if stats:
+        cols["n"] = (np.int32, ())
+        for name, w in FIELDS.items():
+            for s in ("min", "max", "sum"):
+                cols[f"{name}_{s}"] = (np.float32, (w,))
+    else:
+        cols.update(green=(np.int8, ()), phase=(np.int8, ()))
+        for name, w in FIELDS.items():
+            cols[name] = (np.float32, (w,))
+    return cols
+
+
+# ── Store ──────────────────────────────────────────────────────────────────────
+class TelemetryStore:
+    """Raw ring + rollup tiers for one junction, fed by ``sample()``.
+
+    Writes come from the engine thread and reads from session threads; a lock
+    keeps a query from seeing a half-written row.
+    """
+
+    def __init__(self, raw_rows=RAW_ROWS, tiers=TIERS, demand=DEFAULT_DEMAND, sample_s=SAMPLE_S):
+        self.sample_s = sample_s
+        self.demand = demand
+        self.raw = Ring(raw_rows, _columns(False))
+        self.tiers = [(float(w), Ring(rows, _columns(True))) for w, rows in tiers]
+        self._acc = [None] * len(self.tiers)           # open bucket per tier
+        self.queue = np.zeros(K)
+        self.served = np.zeros(K)
+        self.last_t = None
+        self.first_t = None
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.raw.nbytes + sum(r.nbytes for _, r in self.tiers)
+
+    # ── Writing ───────────────────────────────────
+    def sample(self, engine, i, t):
+        """Record junction ``i`` of ``engine`` at epoch time ``t`` if a sample
+        is due."""
+        if self.last_t is not None and t - self.last_t < self.sample_s:
+            return False
+        dt = 0.0 if self.last_t is None else min(t - self.last_t, 10 * self.sample_s)
+        self.last_t = t
+        if self.first_t is None:
+            self.first_t = t
+        d = self.demand
+        vol = engine.volumes[i]
+        g, phase = int(engine.green[i]), int(engine.phase[i])
+        green_s = np.zeros(K)
+        if phase == GREEN and g != NO_ROAD:
+            green_s[g] = dt
+        # Fluid queue: arrivals at the spawn rate, discharge at saturation while green.
+        arrive = vol / 10 * d.spawn_scale / d.spawn_every * dt
+        leave = np.minimum(self.queue + arrive, green_s / d.sat_headway)
+        self.queue += arrive - leave
+        self.served += leave
+        row = {"t": t, "green": g, "phase": phase, "queue": self.queue, "served": self.served,
+               "volume": vol, "green_s": green_s, "emergency": float(engine.emergency[i] != NO_ROAD)}
+        with self._lock:
+            self.raw.append(row)
+            for k, (width, ring) in enumerate(self.tiers):
+                self._roll(k, width, ring, row)
+        return True
+
+    def _roll(self, k, width, ring, row):
+        start = np.floor(row["t"] / width) * width
+        acc = self._acc[k]
+        if acc is not None and acc["t"] != start:
+            ring.append(acc)
+            acc = None
+        if acc is None:
+            acc = {"t": start, "n": 0}
+            for name in FIELDS:
+                v = np.atleast_1d(np.asarray(row[name], dtype=np.float32))
+                acc[f"{name}_min"] = v.copy()
+                acc[f"{name}_max"] = v.copy()
+                acc[f"{name}_sum"] = np.zeros_like(v)
+            self._acc[k] = acc
+        acc["n"] += 1
+        for name in FIELDS:
+            v = np.atleast_1d(row[name])
+            np.minimum(acc[f"{name}_min"], v, out=acc[f"{name}_min"])
+            np.maximum(acc[f"{name}_max"], v, out=acc[f"{name}_max"])
+            acc[f"{name}_sum"] += v
+
+    # ── Reading ───────────────────────────────────
+    def series(self, field, t0, t1, points=600):
+        """``{t, min, max, sum, n}`` for ``field`` over ``[t0, t1)`` in at most
+        ``points`` buckets; ``mean = sum / n``.  Arrays are (points', width)."""
+        with self._lock:
+            # Finest ring reaching back to t0 (or to the first sample, while
+            # history is shorter than the window).
+            t_from = max(t0, self.first_t if self.first_t is not None else t0)
+            rings = [(self.raw, False)] + [(r, True) for _, r in self.tiers]
+            ring, stats = next(((r, s) for r, s in rings if r.oldest() <= t_from), rings[-1])
+            idx = ring.span(t0, t1)
+            t = ring.cols["t"][idx]
+            if stats:
+                lo, hi = ring.cols[f"{field}_min"][idx], ring.cols[f"{field}_max"][idx]
+                tot, n = ring.cols[f"{field}_sum"][idx], ring.cols["n"][idx]
+            else:
+                lo = hi = tot = ring.cols[field][idx]
+                n = np.ones(idx.size, dtype=np.int32)
+        if not t.size:
+            empty = np.empty((0,) + lo.shape[1:], np.float32)
+            return {"t": t, "min": empty, "max": empty, "sum": empty, "n": n}
+        t0 = max(t0, t[0])                             # bucket only the span with data
+        width = max(t1 - t0, 1e-9) / points
+        edges = np.flatnonzero(np.diff(np.floor((t - t0) / width), prepend=-1))
+        return {
+            "t": t[edges],
+            "min": np.minimum.reduceat(lo, edges),
+            "max": np.maximum.reduceat(hi, edges),
+            "sum": np.add.reduceat(tot.astype(np.float64), edges),
+            "n": np.add.reduceat(n, edges),
+        }
+
+    def last(self, field):
+        with self._lock:
+            if not self.raw.size:
+                return None
+            return self.raw.cols[field][(self.raw.head - 1) % self.raw.capacity].copy()
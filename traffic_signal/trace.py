@@ -0,0 +1,336 @@
+"""
+Traces
+======
+Compact binary record of a simulated junction, for replay and comparison.
+
+``des.JunctionDES(..., seed=S, trace=TraceRecorder(dir))`` is fully
+deterministic: the same seed, volumes and control schedule give the same
+trace byte for byte.  The recorder buffers events in memory and writes one
+segment file per ``segment_s`` (a day by default) in a single write:
+
+    header   magic, t0, t1, event count, checkpoint count, state width
+    ckpt     t (f8) · first event index (i8) · state (f8 × STATE)
+    events   t (f8) · a (i4) · b (f4) · kind (u1) · road (i1) · code (i1)
+
+Columns are stored whole and widest first, so every column is aligned and a
+reader maps the file once and views each column with ``np.frombuffer``.
+About 19 bytes per event; a busy junction-day is a few MB.
+
+Every ``checkpoint_every`` simulated seconds the full junction state is
+stored, so ``state_at(t)`` starts from the nearest checkpoint and applies
+at most that many seconds of events — seeking never re-simulates.
+
+    python -m traffic_signal.trace record traces/main --volumes 8,6,3 --days 1 --seed 1
+    python -m traffic_signal.trace at traces/main 43200
+    python -m traffic_signal.trace diff traces/main traces/webster
+"""
+
+import argparse
+import json
+import mmap
+import pathlib
+import struct
+
+import numpy as np
+
+from .engine import GREEN, NO_ROAD, PHASES, ROADS
+
+MAGIC = b"TSTRACE1"
+HEADER = struct.Struct("<8sddqqq")                      # magic, t0, t1, n_ev, n_ck, width
+HEADER_SIZE = 64
+
+# Event kinds.  PHASE: road = green road, code = phase, a = cycles, b = duration.
+# SPAWN: a = vehicle, b = speed (px/s).  STOP: a = vehicle, b = queue length after.
+# DEPART: a = vehicle, b = delay (s), code = 1 if it left a queue.
+# EMERGENCY: road = requested road (-1 = cleared), code = 1 if already served.
+# VOLUME: road, b = new volume.
+PHASE, SPAWN, STOP, DEPART, EMERGENCY, VOLUME = range(6)
+KINDS = ("phase", "spawn", "stop", "depart", "emergency", "volume")
+
+K = len(ROADS)
+# Checkpoint state vector layout.
+S_GREEN, S_PHASE, S_PHASE_END, S_CYCLES, S_EMERGENCY, S_HANDLED = range(6)
+S_QUEUE, S_VOLUME, S_SPAWNED, S_CROSSED = (slice(6 + i * K, 6 + (i + 1) * K) for i in range(4))
+STATE = 6 + 4 * K
+
+EVENT_COLUMNS = (("t", "<f8"), ("a", "<i4"), ("b", "<f4"), ("kind", "u1"), ("road", "i1"), ("code", "i1"))
+
+
+# ── Writing ────────────────────────────────────────────────────────────────────
+def write_segment(path, t0, t1, events, checkpoints):
+    """Write one segment.  ``events`` is a list of ``(t, kind, road, code, a, b)``,
+    ``checkpoints`` a list of ``(t, first_event, state)``."""
+    ev = np.array(events, dtype=[("t", "<f8"), ("kind", "u1"), ("road", "i1"),
+                                 ("code", "i1"), ("a", "<i4"), ("b", "<f4")])
+    ck_t = np.array([c[0] for c in checkpoints], dtype="<f8")
+    ck_i = np.array([c[1] for c in checkpoints], dtype="<i8")
+    ck_s = np.array([c[2] for c in checkpoints], dtype="<f8").reshape(len(checkpoints), STATE)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, t0, t1, ev.size, ck_t.size, STATE).ljust(HEADER_SIZE, b"\0"))
+        for col in (ck_t, ck_i, ck_s):
+            f.write(col.tobytes())
+        for name, dtype in EVENT_COLUMNS:
+            f.write(np.ascontiguousarray(ev[name], dtype=dtype).tobytes())
+    tmp.replace(path)
+
+
+class TraceRecorder:
+    """Collects DES events and checkpoints; writes a segment per ``segment_s``.
+
+    Times are simulation seconds plus ``origin`` (e.g. an epoch start), so
+    segments from consecutive runs line up in one archive.
+    """
+
+    def __init__(self, out_dir, junction="main", checkpoint_every=60.0,
+                 segment_s=86400.0, origin=0.0):
+        self.dir = pathlib.Path(out_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.junction = junction
+        self.checkpoint_every = float(checkpoint_every)
+        self.segment_s = float(segment_s)
+        self.origin = float(origin)
+        self._events = []
+        self._ckpts = []
+        self._seg_start = None
+        self._last_t = None
+
+    def event(self, t, kind, road, code=0, a=0, b=0.0):
+        self._events.append((self.origin + t, kind, road, code, a, b))
+
+    def checkpoint(self, t, state):
+        t = self.origin + t
+        if self._seg_start is None:
+            self._seg_start = np.floor(t / self.segment_s) * self.segment_s
+        elif t >= self._seg_start + self.segment_s:
+            self.flush(t)
+            self._seg_start = np.floor(t / self.segment_s) * self.segment_s
+        self._ckpts.append((t, len(self._events), state))
+        self._last_t = t
+
+    def flush(self, t_end=None):
+        if not self._ckpts:
+            return None
+        t0 = self._ckpts[0][0]
+        t1 = t_end if t_end is not None else max(self._last_t, self._events[-1][0] if self._events else t0)
+        path = self.dir / f"{self.junction}-{int(self._seg_start):012d}.trace"
+        write_segment(path, t0, t1, self._events, self._ckpts)
+        self._events, self._ckpts = [], []
+        return path
+
+    def close(self, t_end=None):
+        if not self._events and len(self._ckpts) == 1 and self._seg_start > self.origin:
+            self._ckpts = []                            # lone checkpoint on a boundary
+            return None
+        return self.flush(None if t_end is None else self.origin + t_end)
+
+
+# ── Reading ────────────────────────────────────────────────────────────────────
+class Segment:
+    """One memory-mapped segment file; columns are zero-copy views."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.t0, self.t1, n, nck, width = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or width != STATE:
+            raise ValueError(f"{self.path} is not a compatible trace segment")
+        buf, off = self._mm, HEADER_SIZE
+
+        def take(dtype, count, shape=()):
+            nonlocal off
+            arr = np.frombuffer(buf, dtype=dtype, count=count * int(np.prod(shape or (1,))), offset=off)
+            off += arr.nbytes
+            return arr.reshape((count,) + shape)
+
+        self.ck_t = take("<f8", nck)
+        self.ck_idx = take("<i8", nck)
+        self.ck_state = take("<f8", nck, (STATE,))
+        self.cols = {name: take(dtype, n) for name, dtype in EVENT_COLUMNS}
+        self.n = n
+
+    def events(self, t0, t1):
+        """Column views of the events with ``t0 <= t < t1``."""
+        t = self.cols["t"]
+        i0, i1 = np.searchsorted(t, t0, "left"), np.searchsorted(t, t1, "left")
+        return {k: v[i0:i1] for k, v in self.cols.items()}
+
+    def state_at(self, t):
+        """Junction state at time ``t``: the nearest checkpoint at or before
+        ``t`` plus the events since."""
+        c = max(int(np.searchsorted(self.ck_t, t, "right")) - 1, 0)
+        s = self.ck_state[c].copy()
+        i0 = int(self.ck_idx[c])
+        i1 = int(np.searchsorted(self.cols["t"], t, "right"))
+        ev = {k: v[i0:max(i0, i1)] for k, v in self.cols.items()}
+        kind, road = ev["kind"], ev["road"].astype(np.int64)
+
+        def per_road(mask, weights=None):
+            return np.bincount(road[mask], weights=None if weights is None else weights[mask], minlength=K)
+
+        s[S_QUEUE] += per_road(kind == STOP) - per_road((kind == DEPART) & (ev["code"] == 1))
+        s[S_SPAWNED] += per_road(kind == SPAWN)
+        s[S_CROSSED] += per_road(kind == DEPART)
+        vol = np.flatnonzero(kind == VOLUME)
+        for r in range(K):                              # latest volume per road
+            last = vol[road[vol] == r]
+            if last.size:
+                s[S_VOLUME][r] = ev["b"][last[-1]]
+        ph = np.flatnonzero(kind == PHASE)
+        if ph.size:
+            j = ph[-1]
+            s[S_GREEN], s[S_PHASE] = road[j], ev["code"][j]
+            s[S_PHASE_END] = ev["t"][j] + ev["b"][j]
+            s[S_CYCLES] = ev["a"][j]
+        em = np.flatnonzero(kind == EMERGENCY)
+        since = 0
+        if em.size:
+            j = em[-1]
+            s[S_EMERGENCY], s[S_HANDLED] = road[j], ev["code"][j]
+            since = j + 1
+        if s[S_EMERGENCY] != NO_ROAD:
+            later = ph[ph >= since]
+            served = (ev["code"][later] == GREEN) & (road[later] == s[S_EMERGENCY])
+            s[S_HANDLED] = max(s[S_HANDLED], float(served.any()))
+        return state_dict(t, s)
+
+    def close(self):
+        self.cols = self.ck_state = self.ck_t = self.ck_idx = None
+        self._mm.close()
+
+
+def state_dict(t, s):
+    g, e = int(s[S_GREEN]), int(s[S_EMERGENCY])
+    return {
+        "t": float(t),
+        "green": ROADS[g] if g != NO_ROAD else None,
+        "phase": PHASES[int(s[S_PHASE])],
+        "remaining": max(0.0, float(s[S_PHASE_END] - t)),
+        "cycles": int(s[S_CYCLES]),
+        "emergency": ROADS[e] if e != NO_ROAD else None,
+        "emgHandled": bool(s[S_HANDLED]),
+        "queue": dict(zip(ROADS, s[S_QUEUE].astype(int).tolist())),
+        "volumes": dict(zip(ROADS, s[S_VOLUME].tolist())),
+        "spawned": dict(zip(ROADS, s[S_SPAWNED].astype(int).tolist())),
+        "crossed": dict(zip(ROADS, s[S_CROSSED].astype(int).tolist())),
+    }
+
+
+class TraceArchive:
+    """All segments of one junction in a directory, opened on demand."""
+
+    def __init__(self, directory, junction=None):
+        self.dir = pathlib.Path(directory)
+        paths = sorted(self.dir.glob(f"{junction or '*'}-*.trace"))
+        if not paths:
+            raise FileNotFoundError(f"no trace segments in {self.dir}")
+        self.paths = paths
+        self.starts = np.array([float(p.stem.rsplit("-", 1)[1]) for p in paths])
+        self._open = {}
+
+    def segment(self, i):
+        if i not in self._open:
+            self._open[i] = Segment(self.paths[i])
+        return self._open[i]
+
+    def _index(self, t):
+        return min(max(int(np.searchsorted(self.starts, t, "right")) - 1, 0), len(self.paths) - 1)
+
+    @property
+    def t0(self):
+        return self.segment(0).t0
+
+    @property
+    def t1(self):
+        return self.segment(len(self.paths) - 1).t1
+
+    def state_at(self, t):
+        return self.segment(self._index(t)).state_at(t)
+
+    def events(self, t0, t1):
+        parts = [self.segment(i).events(t0, t1)
+                 for i in range(self._index(t0), self._index(t1) + 1)]
+        return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    def play(self, t0, t1, step=1.0):
+        """States every ``step`` seconds over ``[t0, t1)``."""
+        for t in np.arange(t0, t1, step):
+            yield self.state_at(t)
+
+    def summary(self, t0, t1):
+        """Per-road crossings and mean delay over a window, from DEPART events."""
+        ev = self.events(t0, t1)
+        dep = ev["kind"] == DEPART
+        road = ev["road"][dep].astype(np.int64)
+        n = np.bincount(road, minlength=K)
+        delay = np.bincount(road, weights=ev["b"][dep], minlength=K)
+        return {r: {"crossed": int(n[i]), "mean_delay": float(delay[i] / n[i]) if n[i] else 0.0}
+                for i, r in enumerate(ROADS)}
+
+    def close(self):
+        for seg in self._open.values():
+            seg.close()
+        self._open.clear()
+
+
+# ── CLI ────────────────────────────────────────────────────────────────────────
+def _record(args):
+    from .des import JunctionDES
+    from .plans import PlanTable
+    planner = PlanTable.build().lookup if args.webster else None
+    rec = TraceRecorder(args.dir, args.junction or "main", args.checkpoint)
+    des = JunctionDES([int(v) for v in args.volumes.split(",")], seed=args.seed,
+                      planner=planner, trace=rec)
+    res = des.run(args.days * 86400)
+    rec.close(args.days * 86400)
+    print(json.dumps(res.summary(), indent=1))
+
+
+def _at(args):
+    arc = TraceArchive(args.dir, args.junction)
+    for st in arc.play(args.t, args.t + args.seconds, args.step):
+        print(json.dumps(st))
+
+
+def _diff(args):
+    a, b = TraceArchive(args.a, args.junction), TraceArchive(args.b, args.junction)
+    t0, t1 = max(a.t0, b.t0), min(a.t1, b.t1)
+    edges = np.arange(t0, t1, args.window)
+    print(f"{'from':>10} " + " ".join(f"{r:>16}" for r in ROADS))
+    for lo in edges:
+        sa, sb = a.summary(lo, lo + args.window), b.summary(lo, lo + args.window)
+        cells = [f"{sa[r]['mean_delay']:6.1f}→{sb[r]['mean_delay']:6.1f}s" for r in ROADS]
+        print(f"{lo:10.0f} " + " ".join(f"{c:>16}" for c in cells))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.trace",
+                                 description=__doc__.split("\n\n")[0])
+    ap.add_argument("--junction", default=None, help="junction id prefix of the segment files")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("record", help="simulate with a seed and write a trace")
+    p.add_argument("dir")
+    p.add_argument("--volumes", default="5,5,5")
+    p.add_argument("--days", type=float, default=1.0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--webster", action="store_true", help="run the Webster plan controller")
+    p.add_argument("--checkpoint", type=float, default=60.0, help="seconds between checkpoints")
+    p.set_defaults(fn=_record)
+    p = sub.add_parser("at", help="print the replayed state from time T")
+    p.add_argument("dir")
+    p.add_argument("t", type=float)
+    p.add_argument("--seconds", type=float, default=1.0)
+    p.add_argument("--step", type=float, default=1.0)
+    p.set_defaults(fn=_at)
+    p = sub.add_parser("diff", help="compare mean delay per window between two traces")
+    p.add_argument("a")
+    p.add_argument("b")
+    p.add_argument("--window", type=float, default=3600.0)
+    p.set_defaults(fn=_diff)
+    args = ap.parse_args(argv)
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
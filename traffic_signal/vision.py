@@ -0,0 +1,341 @@
+"""
+Video Counting
+==============
+CPU vehicle counting on recorded approach video, one stream per road.
+
+Each lane gets a polygon drawn as a short band across the lane (a virtual
+loop detector), in coordinates normalised to 0–1 so it survives any working
+resolution.  Frames are reduced to small grayscale images, compared with a
+running background, and each lane's foreground occupancy is one matrix
+product per batch.  A vehicle is counted when a lane's occupancy rises
+above ``on`` after having dropped below ``off``.
+
+Decoding runs ahead in a thread per stream, a few frames per batch.  When
+a stream falls behind ``target_speed`` × real time it first skips frames
+(``grab()`` without decoding to pixels) and then halves its working
+resolution; it backs off again once it has headroom.
+
+Counts come out as the detector JSON lines ``ingest`` reads::
+
+    python -m traffic_signal.vision lanes.json --out /tmp/detectors.fifo
+    TRAFFIC_DETECTORS=pipe:/tmp/detectors.fifo streamlit run app.py
+
+``lanes.json``::
+
+    {"junction": "main", "interval": 5,
+     "streams": [{"road": "north", "video": "north.mp4",
+                  "lanes": [{"lane": 0, "polygon": [[0.40, 0.62], [0.50, 0.62],
+                                                    [0.50, 0.66], [0.40, 0.66]]}]}]}
+
+Decoding needs OpenCV (``pip install opencv-python-headless``); counting
+itself is NumPy only, so ``LaneCounter`` also accepts frames from elsewhere.
+"""
+
+import argparse
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:                                   # decoding is optional
+    cv2 = None
+
+from .engine import road_index
+
+WORK_WIDTH = 320                  # px, working width at full quality
+MIN_WIDTH = 80
+MAX_STRIDE = 6                    # decode at most every 6th frame when behind
+BATCH = 16                        # frames per batch
+POLL = 0.5                        # s, how often a waiting job checks its decoder
+
+
+# ── Lane geometry ──────────────────────────────────────────────────────────────
+def polygon_mask(polygon, height, width):
+    """Boolean (height, width) mask of a normalised polygon (even-odd rule)."""
+    poly = np.asarray(polygon, dtype=np.float64) * (width, height)
+    ys, xs = np.mgrid[0:height, 0:width]
+    px, py = xs.ravel() + 0.5, ys.ravel() + 0.5
+    inside = np.zeros(px.size, dtype=bool)
+    x0, y0 = poly[-1]
+    for x1, y1 in poly:
+        crosses = (y0 > py) != (y1 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xi = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (px < xi)
+        x0, y0 = x1, y1
+    return inside.reshape(height, width)
+
+
+def zone_matrix(polygons, height, width):
+    """(height·width, lanes) float32 matrix; ``fg @ Z`` is per-lane occupancy."""
+    z = np.stack([polygon_mask(p, height, width).ravel() for p in polygons], axis=1)
+    return (z / np.maximum(z.sum(axis=0), 1)).astype(np.float32)
+
+
+# ── Counting ───────────────────────────────────────────────────────────────────
+class LaneCounter:
+    """Background subtraction + per-lane hysteresis counting for one stream.
+
+    ``feed(frames)`` takes a (B, H, W) uint8 grayscale batch at any working
+    size (geometry is rebuilt when the size changes) and returns the number
+    of vehicles that entered each lane's zone in that batch.
+    """
+
+    def __init__(self, polygons, learn=0.05, diff=25, on=0.30, off=0.12):
+        self.polygons = list(polygons)
+        self.learn, self.diff, self.on, self.off = learn, diff, on, off
+        self.shape = None
+        self.zones = None
+        self.bg = None
+        self.occupied = np.zeros(len(self.polygons), dtype=bool)
+
+    def _reshape(self, h, w, first):
+        self.shape = (h, w)
+        self.zones = zone_matrix(self.polygons, h, w)
+        if self.bg is not None:                       # keep the learned background
+            idx_y = np.linspace(0, self.bg.shape[0] - 1, h).astype(int)
+            idx_x = np.linspace(0, self.bg.shape[1] - 1, w).astype(int)
+            self.bg = self.bg[np.ix_(idx_y, idx_x)]
+        else:
+            self.bg = first.astype(np.float32)
+
+    def feed(self, frames):
+        frames = np.asarray(frames)
+        b, h, w = frames.shape
+        if self.shape != (h, w):
+            self._reshape(h, w, frames[0])
+        f = frames.astype(np.float32)
+        fg = (np.abs(f - self.bg) > self.diff).reshape(b, -1).astype(np.float32)
+        occ = fg @ self.zones                          # (B, lanes)
+        # Learn from the batch mean, so slow light changes fade into the
+        # background but a passing vehicle (a few frames) barely registers.
+        self.bg += self.learn * (f.mean(axis=0) - self.bg)
+        return self._count(occ)
+
+    def _count(self, occ):
+        # Hysteresis as a forward fill: on → 1, off → 0, in between keeps
+        # the previous state.
+        level = np.where(occ >= self.on, 1, np.where(occ <= self.off, 0, -1))
+        level = np.vstack([self.occupied.astype(int)[None], level])
+        idx = np.where(level >= 0, np.arange(level.shape[0])[:, None], 0)
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        state = np.take_along_axis(level, idx, axis=0).astype(bool)
+        self.occupied = state[-1]
+        return (state[1:] & ~state[:-1]).sum(axis=0)
+
+
+# ── Decoding ───────────────────────────────────────────────────────────────────
+class Throttle:
+    """Frame stride and working width that keep a stream at ``target_speed``."""
+
+    def __init__(self, target_speed=1.0, width=WORK_WIDTH):
+        self.target = target_speed
+        self.stride = 1
+        self.width = width
+        self.full_width = width
+
+    def update(self, video_s, wall_s):
+        speed = video_s / max(wall_s, 1e-9)
+        if speed < self.target:
+            if self.stride < MAX_STRIDE:
+                self.stride += 1
+            elif self.width > MIN_WIDTH:
+                self.width = max(MIN_WIDTH, self.width // 2)
+        elif speed > 2 * self.target:
+            if self.width < self.full_width:
+                self.width = min(self.full_width, self.width * 2)
+            elif self.stride > 1:
+                self.stride -= 1
+        return speed
+
+
+def open_video(path):
+    if cv2 is None:
+        raise RuntimeError("video decoding needs OpenCV: pip install opencv-python-headless")
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise RuntimeError(f"cannot open video {path!r}")
+    return cap
+
+
+def read_batches(cap, throttle, out, stop):
+    """Decode ``cap`` into ``(t_video, frames)`` batches on ``out``.
+
+    Skipped frames are only ``grab()``-ed, which advances the decoder without
+    converting pixels; kept frames are converted to gray and shrunk to the
+    throttle's width.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    n, batch, t = 0, [], 0.0
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                pass
+
+    while not stop.is_set():
+        if n % throttle.stride:
+            ok = cap.grab()
+        else:
+            ok, frame = cap.read()
+            if ok:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                h, w = gray.shape
+                width = min(throttle.width, w)
+                small = cv2.resize(gray, (width, max(1, round(h * width / w))),
+                                   interpolation=cv2.INTER_AREA)
+                if batch and small.shape != batch[0].shape:   # width changed
+                    put((t, np.stack(batch)))
+                    batch = []
+                batch.append(small)
+                t = n / fps
+                if len(batch) >= BATCH:
+                    put((t, np.stack(batch)))
+                    batch = []
+        if not ok:
+            break
+        n += 1
+    if batch:
+        put((t, np.stack(batch)))
+    put(None)
+
+
+# ── Pipeline ───────────────────────────────────────────────────────────────────
+class StreamJob:
+    """One approach video: decode thread → counter → interval counts."""
+
+    def __init__(self, junction, road, video, lanes, interval, emit, start, target_speed, pace):
+        road_index(road)
+        self.junction, self.road, self.video = junction, road, video
+        self.lanes = [l.get("lane", i) for i, l in enumerate(lanes)]
+        self.counter = LaneCounter([l["polygon"] for l in lanes])
+        self.interval, self.emit, self.start = interval, emit, start
+        self.throttle = Throttle(target_speed)
+        self.pace = pace
+        self.stats = {"frames": 0, "video_s": 0.0, "speed": 0.0}
+
+    def run(self, decoders, stop):
+        """Count the stream to its end.  ``decoders`` must be a pool of its
+        own: a decoder queued behind the jobs waiting on it would never run."""
+        cap = open_video(self.video)
+        batches = queue.Queue(maxsize=4)               # decode stays ≤ 4 batches ahead
+        reader = decoders.submit(read_batches, cap, self.throttle, batches, stop)
+        totals = np.zeros(len(self.lanes), dtype=np.int64)
+        edge = self.interval
+        t0 = time.monotonic()
+        mark_wall, mark_video, slept = t0, 0.0, 0.0
+        try:
+            while (item := self._next(batches, reader)) is not None:
+                t_video, frames = item
+                totals += self.counter.feed(frames)
+                self.stats["frames"] += len(frames)
+                self.stats["video_s"] = t_video
+                while t_video >= edge:                 # close finished intervals
+                    self._emit(totals, edge)
+                    totals[:] = 0
+                    edge += self.interval
+                if self.pace:
+                    nap = max(0.0, t0 + t_video - time.monotonic())
+                    time.sleep(nap)
+                    slept += nap
+                now = time.monotonic()
+                if now - mark_wall >= 1.0:                # speed of the work, not the naps
+                    busy = now - mark_wall - slept
+                    self.stats["speed"] = self.throttle.update(t_video - mark_video, busy)
+                    mark_wall, mark_video, slept = now, t_video, 0.0
+            if totals.any():
+                self._emit(totals, self.stats["video_s"])
+        finally:
+            stop.set()
+            reader.result()
+            cap.release()
+
+    @staticmethod
+    def _next(batches, reader):
+        """The next batch, or None at the end.  A decoder that failed never
+        sends the end marker, so its error is raised here instead."""
+        while True:
+            try:
+                return batches.get(timeout=POLL)
+            except queue.Empty:
+                if reader.done():
+                    reader.result()
+                    return None
+
+    def _emit(self, totals, t_video):
+        for lane, c in zip(self.lanes, totals.tolist()):
+            self.emit({"junction": self.junction, "road": self.road, "lane": lane,
+                       "count": c, "t": round(self.start + t_video, 3)})
+
+
+def run_config(config, emit, target_speed=1.0, pace=False, workers=None):
+    """Count every stream of a ``lanes.json`` config concurrently.
+
+    ``workers`` caps the counting threads (default one per stream); each
+    stream also gets a decoder thread.  The first failure stops the other
+    streams and is raised.
+    """
+    junction = config.get("junction", "main")
+    interval = float(config.get("interval", 5.0))
+    start = float(config.get("start", time.time()))
+    lock = threading.Lock()
+
+    def safe_emit(msg):
+        with lock:
+            emit(msg)
+
+    jobs = [StreamJob(junction, s["road"], s["video"], s["lanes"], interval,
+                      safe_emit, start, target_speed, pace) for s in config["streams"]]
+    stops = [threading.Event() for _ in jobs]
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="decode") as decoders, \
+            ThreadPoolExecutor(max_workers=workers or len(jobs), thread_name_prefix="count") as pool:
+        runners = [pool.submit(j.run, decoders, s) for j, s in zip(jobs, stops)]
+        try:
+            for r in runners:
+                r.result()
+        except BaseException:
+            for s in stops:
+                s.set()
+            raise
+    return jobs
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m traffic_signal.vision",
+                                 description=__doc__.split("\n\n")[0])
+    ap.add_argument("config", help="lanes.json with junction, interval and streams")
+    ap.add_argument("--out", default="-", help="JSON-lines output file or FIFO ('-' for stdout)")
+    ap.add_argument("--tcp", help="send to an ingest tcp:// source instead, as HOST:PORT")
+    ap.add_argument("--target-speed", type=float, default=1.0,
+                    help="minimum multiple of real time before frames are skipped")
+    ap.add_argument("--pace", action="store_true", help="emit no faster than real time")
+    args = ap.parse_args(argv)
+    config = json.loads(open(args.config).read())
+
+    if args.tcp:
+        host, port = args.tcp.rsplit(":", 1)
+        sink = socket.create_connection((host, int(port))).makefile("w", buffering=1)
+    else:
+        sink = sys.stdout if args.out == "-" else open(args.out, "w", buffering=1)
+
+    t0 = time.perf_counter()
+    jobs = run_config(config, lambda m: sink.write(json.dumps(m) + "\n"), args.target_speed, args.pace)
+    wall = time.perf_counter() - t0
+    for j in jobs:
+        print(f"{j.road:>6}: {j.stats['frames']} frames, {j.stats['video_s']:.0f} s of video "
+              f"in {wall:.1f} s ({j.stats['video_s'] / max(wall, 1e-9):.1f}× real time, "
+              f"stride {j.throttle.stride}, {j.throttle.width}px)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()